@@ -1,18 +1,54 @@
 import os
+import json
 import asyncio
 import time
 import datetime
 import shutil
 import subprocess
 import sys
+from collections import deque
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from watchdog.observers.polling import PollingObserver
+from .index import ProcessedIndex
+from .pipeline import Pipeline, Stage
 from .scanner import Scanner
+from .watcher import Watcher
 
 class AgentClient:
-    def __init__(self, watch_directory, analyze_images=True):
-        self.scanner = Scanner(watch_directory)
+    def __init__(self, watch_directory, analyze_images=True, watch=False, watch_polling=False, poll_interval=2.0,
+                 index_path="processed_index.db", index_content_hash=False, workers=4,
+                 stage_workers=None, max_inflight_bytes=512 * 1024 * 1024, batch_size=8,
+                 model_ready_timeout=300.0, watch_report_files=100):
+        # Durable index of uploaded files so restarts never re-upload
+        self.index = ProcessedIndex(index_path, use_content_hash=index_content_hash)
+        self.scanner = Scanner(watch_directory, index=self.index)
         self.analyze_images = analyze_images
+        # Watch mode keeps the agent running and processes files as they appear
+        self.watch = watch
+        self.watch_polling = watch_polling
+        self.poll_interval = poll_interval
+        # Watch mode runs indefinitely, so its report keeps only the latest files
+        self.watch_report_files = watch_report_files
+        # Per-stage concurrency over the same MCP session; stages not listed
+        # in stage_workers default to `workers`
+        self.stage_workers = {stage: workers for stage in ("analyze", "route", "upload", "cleanup")}
+        self.stage_workers.update(stage_workers or {})
+        self.queue_size = max(1, workers) * 2
+        # Cap on the total size of files between admission and cleanup (0 = unlimited)
+        self.max_inflight_bytes = max_inflight_bytes
+        # Max files per analyze_images/upload_files call (1 = single-file tools)
+        self.batch_size = max(1, batch_size)
+        # How long analysis waits for the server to finish loading the model
+        self.model_ready_timeout = model_ready_timeout
+        self._model_ready_task = None
+        self._in_flight = set()
+        # Session-lifetime memo of (year, month, media_type) -> Drive folder ID
+        self._routes = {}
+        self._route_locks = {}
+        self._session = None
+        self._report = None
+        self._pipeline = None
         # We will start the server as a module
         # self.server_script = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gdrive_server', 'server.py')
     
@@ -27,7 +63,10 @@ class AgentClient:
         print(f"Failed: {report['failed']}")
         
         if report['files']:
-            print("\nDetails:")
+            if len(report['files']) < report['total_files_found']:
+                print(f"\nDetails (last {len(report['files'])} files):")
+            else:
+                print("\nDetails:")
             for i, file_info in enumerate(report['files'], 1):
                 print(f"\n  {i}. {file_info['original_name']}")
                 print(f"     Type: {file_info.get('type', 'unknown')}")
@@ -39,6 +78,313 @@ class AgentClient:
         
         print("\n" + "="*60 + "\n")
         
+    async def _run_blocking(self, func, *args):
+        """Run a blocking filesystem/index call in the default thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+    
+    async def _submit(self, record, check_index=False):
+        """
+        Claim a scanned/watched file and admit it to the pipeline.
+        Scanned records were already checked against the index by iter_scan;
+        watcher records pass check_index=True.
+        """
+        filepath = record.path
+        
+        # Skip files that are already being handled (e.g. our own rename
+        # showing up as a watch event). Check-and-add happens before any await
+        # so concurrent producers can't both claim the same path.
+        if filepath in self._in_flight:
+            return
+        self._in_flight.add(filepath)
+        
+        if check_index:
+            try:
+                already_processed = await self._run_blocking(self.scanner.is_processed, record)
+            except Exception:
+                self._in_flight.discard(filepath)
+                raise
+            if already_processed:
+                self._in_flight.discard(filepath)
+                return
+        
+        # Reserve the report slot up front so the summary keeps discovery order
+        job = _FileJob(record)
+        self._report["total_files_found"] += 1
+        self._report["files"].append(job.file_report)
+        await self._pipeline.put(job, record.size)
+    
+    async def _wait_for_model(self):
+        """
+        Waits (once per session) for the server to finish loading the vision
+        model, so the first analyses don't run into a cold start timeout.
+        """
+        deadline = time.monotonic() + self.model_ready_timeout
+        announced = False
+        while True:
+            result = await self._session.call_tool("inference_status", arguments={})
+            status = json.loads(result.content[0].text)
+            if status["state"] != "loading":
+                if status["state"] == "ready" and announced:
+                    print(f"Vision model {status['model']} ready ({status['load_seconds']}s).")
+                elif status["state"] == "error":
+                    print(f"⚠ Vision model failed to load: {status['error']}")
+                return
+            if time.monotonic() > deadline:
+                print("⚠ Vision model still loading, continuing anyway.")
+                return
+            if not announced:
+                print(f"Waiting for vision model {status['model']} to load...")
+                announced = True
+            await asyncio.sleep(1.0)
+    
+    async def _model_ready(self):
+        if self._model_ready_task is None:
+            self._model_ready_task = asyncio.ensure_future(self._wait_for_model())
+        try:
+            await asyncio.shield(self._model_ready_task)
+        except Exception as e:
+            # Older servers without inference_status: just start analyzing
+            print(f"⚠ Could not check vision model status: {e}")
+    
+    async def _analyze_stage(self, job):
+        """Analyze image/video, get a suggested name and rename the local file."""
+        filename, file_type = job.filename, job.record.file_type
+        if not self.analyze_images:
+            print(f"Processing {filename} ({file_type})...")
+            return True
+        
+        await self._model_ready()
+        print(f"Analyzing {filename} ({file_type})...")
+        analysis_result = await self._session.call_tool("analyze_image", arguments={"local_path": job.filepath})
+        suggested_name = analysis_result.content[0].text.strip()
+        await self._apply_analysis(job, not suggested_name.startswith("Error"), suggested_name)
+        return True
+    
+    async def _analyze_batch_stage(self, jobs):
+        """Batch version of _analyze_stage: one analyze_images call for every waiting file."""
+        if not self.analyze_images:
+            return [await self._analyze_stage(job) for job in jobs]
+        
+        await self._model_ready()
+        for job in jobs:
+            print(f"Analyzing {job.filename} ({job.record.file_type})...")
+        analysis_result = await self._session.call_tool("analyze_images", arguments={"local_paths": [job.filepath for job in jobs]})
+        results = json.loads(analysis_result.content[0].text)
+        outcomes = []
+        for job, item in zip(jobs, results):
+            # An error renaming one file only fails that file, not the batch
+            try:
+                await self._apply_analysis(job, item["ok"], item.get("suggested_name") or item.get("error", ""))
+                outcomes.append(True)
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+    
+    async def _apply_analysis(self, job, ok, text):
+        """Rename the local file to the suggested name (analysis failures keep the original name)."""
+        filename = job.filename
+        if not ok:
+            print(f"  [{filename}] ⚠ Warning: Analysis failed, keeping original name: {text}")
+            return
+        
+        suggested_name = text.strip()
+        print(f"  [{filename}] → Suggested name: {suggested_name}")
+        job.file_report["suggested_name"] = suggested_name
+        
+        # Rename file with suggested name
+        dir_path = os.path.dirname(job.filepath)
+        new_filepath = os.path.join(dir_path, suggested_name)
+        if new_filepath == job.filepath:
+            return
+        
+        # Claims the target in _in_flight so concurrent jobs can't pick it too
+        new_filepath = await self._claim_free_path(new_filepath)
+        job.claimed.append(new_filepath)
+        job.file_report["suggested_name"] = os.path.basename(new_filepath)
+        try:
+            await self._run_blocking(os.rename, job.filepath, new_filepath)
+            print(f"  [{filename}] ✓ Renamed")
+            job.filepath = new_filepath
+        except OSError as e:
+            print(f"  [{filename}] ⚠ Warning: Could not rename: {e}")
+    
+    async def _claim_free_path(self, filepath):
+        """
+        Returns filepath, or name_2.ext, name_3.ext, ... if it already exists
+        on disk or is claimed by another job, and claims the result.
+        Different screenshots often get the same suggested name; renaming
+        onto an existing file would silently overwrite it.
+        """
+        stem, ext = os.path.splitext(filepath)
+        candidate = filepath
+        counter = 2
+        while True:
+            if candidate not in self._in_flight:
+                exists = await self._run_blocking(os.path.lexists, candidate)
+                # Re-check after the await: another job may have claimed it meanwhile
+                if not exists and candidate not in self._in_flight:
+                    self._in_flight.add(candidate)
+                    return candidate
+            candidate = f"{stem}_{counter}{ext}"
+            counter += 1
+    
+    async def _resolve_route(self, year, month, media_type):
+        """
+        Returns the Drive folder ID for a route, calling ensure_folder_structure
+        only on a miss. Concurrent misses for the same route share one call.
+        """
+        key = (year, month, media_type)
+        folder_id = self._routes.get(key)
+        if folder_id:
+            return folder_id
+        
+        lock = self._route_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            folder_id = self._routes.get(key)
+            if folder_id:
+                return folder_id
+            result = await self._session.call_tool("ensure_folder_structure", arguments={"year": year, "month": month, "media_type": media_type})
+            folder_id = result.content[0].text
+            if "Error" not in folder_id:
+                self._routes[key] = folder_id
+            return folder_id
+    
+    def _invalidate_route(self, folder_id):
+        for key, cached in list(self._routes.items()):
+            if cached == folder_id:
+                del self._routes[key]
+    
+    async def _route_stage(self, job):
+        """Resolve the Drive folder for the file's year/month/media type."""
+        # Route by the mtime captured during the scan (rename preserves it)
+        dt = datetime.datetime.fromtimestamp(job.record.mtime)
+        job.year = dt.year
+        job.month = dt.month
+        
+        # Ensure folder structure (Images or Videos)
+        job.media_type = "videos" if job.record.file_type == "video" else "images"
+        folder_id = await self._resolve_route(job.year, job.month, job.media_type)
+        
+        if "Error" in folder_id:
+            print(f"  [{job.filename}] ✗ Failed to create folder structure: {folder_id}")
+            job.file_report["error"] = folder_id
+            return False
+        job.folder_id = folder_id
+        return True
+    
+    async def _upload_stage(self, job):
+        print(f"  [{job.filename}] → Uploading to Google Drive ({job.year}/{job.month})...")
+        upload_result = await self._session.call_tool("upload_file", arguments={"local_path": job.filepath, "folder_id": job.folder_id})
+        return await self._handle_upload_result(job, upload_result.content[0].text)
+    
+    async def _upload_batch_stage(self, jobs):
+        """Batch version of _upload_stage: one upload_files call for every waiting file."""
+        for job in jobs:
+            print(f"  [{job.filename}] → Uploading to Google Drive ({job.year}/{job.month})...")
+        items = [{"local_path": job.filepath, "folder_id": job.folder_id} for job in jobs]
+        upload_result = await self._session.call_tool("upload_files", arguments={"items": items})
+        results = json.loads(upload_result.content[0].text)
+        
+        outcomes = []
+        for job, item in zip(jobs, results):
+            if item["ok"]:
+                text = f"Successfully uploaded file. File ID: {item['file_id']}"
+            else:
+                text = item["error"]
+            # A failing retry for one item must not fail the items already
+            # uploaded: they still need cleanup so they're indexed and deleted
+            try:
+                outcomes.append(await self._handle_upload_result(job, text))
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+    
+    async def _handle_upload_result(self, job, upload_text):
+        if "Folder not found" in upload_text:
+            # The cached parent was deleted on Drive; re-resolve and retry once
+            self._invalidate_route(job.folder_id)
+            folder_id = await self._resolve_route(job.year, job.month, job.media_type)
+            if "Error" not in folder_id:
+                job.folder_id = folder_id
+                upload_result = await self._session.call_tool("upload_file", arguments={"local_path": job.filepath, "folder_id": job.folder_id})
+                upload_text = upload_result.content[0].text
+        print(f"  [{job.filename}] → {upload_text}")
+        
+        if "Successfully" not in upload_text:
+            print(f"  [{job.filename}] ✗ Upload failed")
+            job.file_report["error"] = upload_text
+            return False
+        return True
+    
+    async def _cleanup_stage(self, job):
+        """Record the upload in the index and delete the local copy."""
+        await self._run_blocking(self.scanner.mark_processed, job.record._replace(path=job.filepath))
+        try:
+            await self._run_blocking(os.remove, job.filepath)
+            print(f"  [{job.filename}] ✓ Deleted local file")
+            job.file_report["status"] = "success"
+        except OSError as e:
+            print(f"  [{job.filename}] ⚠ Could not delete: {e}")
+            job.file_report["status"] = "uploaded_but_not_deleted"
+        return True
+    
+    async def _on_job_done(self, job, error=None):
+        """Called once per job when it leaves the pipeline, successfully or not."""
+        if error is not None:
+            print(f"  [{job.filename}] ✗ Error: {str(error)}")
+            job.file_report["error"] = str(error)
+        
+        if job.file_report["status"] == "failed":
+            self._report["failed"] += 1
+        else:
+            self._report["successful"] += 1
+        self._report["processed"] += 1
+        
+        for path in job.claimed:
+            self._in_flight.discard(path)
+    
+    def _build_pipeline(self):
+        workers = self.stage_workers
+        if self.batch_size > 1:
+            # Drain up to batch_size waiting files into one batch tool call
+            analyze = Stage("analyze", self._analyze_batch_stage, workers.get("analyze", 1), self.batch_size)
+            upload = Stage("upload", self._upload_batch_stage, workers.get("upload", 1), self.batch_size)
+        else:
+            analyze = Stage("analyze", self._analyze_stage, workers.get("analyze", 1))
+            upload = Stage("upload", self._upload_stage, workers.get("upload", 1))
+        return Pipeline(
+            [
+                analyze,
+                Stage("route", self._route_stage, workers.get("route", 1)),
+                upload,
+                Stage("cleanup", self._cleanup_stage, workers.get("cleanup", 1)),
+            ],
+            on_done=self._on_job_done,
+            queue_size=self.queue_size,
+            byte_limit=self.max_inflight_bytes,
+        )
+    
+    def _start_watcher(self):
+        """Start watching before the initial scan so no file created meanwhile is missed."""
+        watcher = Watcher(
+            self.scanner,
+            use_polling=self.watch_polling,
+            poll_interval=self.poll_interval,
+        )
+        watcher.start()
+        return watcher
+    
+    async def _watch(self, watcher):
+        """Submit new files as filesystem events arrive until cancelled."""
+        mode = "polling" if isinstance(watcher.observer, PollingObserver) else "filesystem events"
+        print(f"Watching {self.scanner.watch_directory} for new files ({mode}). Press Ctrl+C to stop.\n")
+        
+        # Events queued during the scan may repeat scanned files; _in_flight
+        # and the processed index drop those in _submit
+        async for record in watcher.events():
+            await self._submit(record, check_index=True)
+        
     async def run(self):
         # Define server parameters
         python_exe = sys.executable
@@ -56,96 +402,56 @@ class AgentClient:
                 print("Connected to MCP Server.")
                 print("Scanning for screenshots...")
                 
-                files = self.scanner.scan()
-                report = {
-                    "total_files_found": len(files),
+                self._session = session
+                self._report = {
+                    "total_files_found": 0,
                     "processed": 0,
                     "successful": 0,
                     "failed": 0,
-                    "files": []
+                    "files": deque(maxlen=self.watch_report_files) if self.watch else []
                 }
+                self._pipeline = self._build_pipeline()
+                self._pipeline.start()
+                watcher = self._start_watcher() if self.watch else None
                 
-                if not files:
-                    print("\nNo screenshots or recordings found.")
-                else:
-                    print(f"\nFound {len(files)} file(s). Processing...\n")
+                try:
+                    # Files are processed as the scan yields them rather than
+                    # after the whole directory has been listed
+                    async for record in self.scanner.ascan():
+                        if self._report["total_files_found"] == 0:
+                            print("\nProcessing files as they are found...\n")
+                        await self._submit(record)
                     
-                    for filepath, file_type in files:
-                        filename = os.path.basename(filepath)
-                        file_report = {"original_name": filename, "type": file_type, "status": "failed"}
-                        
-                        try:
-                            # Analyze image/video and get suggested name (if enabled)
-                            if self.analyze_images:
-                                print(f"Analyzing {filename} ({file_type})...")
-                                analysis_result = await session.call_tool("analyze_image", arguments={"local_path": filepath})
-                                suggested_name = analysis_result.content[0].text.strip()
-                                print(f"  → Suggested name: {suggested_name}")
-                                file_report["suggested_name"] = suggested_name
-                                
-                                # Rename file with suggested name
-                                dir_path = os.path.dirname(filepath)
-                                new_filepath = os.path.join(dir_path, suggested_name)
-                                
-                                if new_filepath != filepath:
-                                    try:
-                                        os.rename(filepath, new_filepath)
-                                        print(f"  ✓ Renamed")
-                                        filepath = new_filepath
-                                    except OSError as e:
-                                        print(f"  ⚠ Warning: Could not rename: {e}")
-                            else:
-                                print(f"Processing {filename} ({file_type})...")
-                            
-                            # Extract date from file metadata
-                            timestamp = os.path.getmtime(filepath)
-                            dt = datetime.datetime.fromtimestamp(timestamp)
-                            year = dt.year
-                            month = dt.month
-                            
-                            # Ensure folder structure (Images or Videos)
-                            media_type = "videos" if file_type == "video" else "images"
-                            result = await session.call_tool("ensure_folder_structure", arguments={"year": year, "month": month, "media_type": media_type})
-                            folder_id = result.content[0].text
-                            
-                            if "Error" in folder_id:
-                                print(f"  ✗ Failed to create folder structure: {folder_id}")
-                                file_report["error"] = folder_id
-                                report["failed"] += 1
-                                continue
-                            
-                            print(f"  → Uploading to Google Drive ({year}/{month})...")
-                            upload_result = await session.call_tool("upload_file", arguments={"local_path": filepath, "folder_id": folder_id})
-                            upload_text = upload_result.content[0].text
-                            print(f"  → {upload_text}")
-                            
-                            if "Successfully" in upload_text:
-                                self.scanner.mark_processed(filepath)
-                                try:
-                                    os.remove(filepath)
-                                    print(f"  ✓ Deleted local file")
-                                    file_report["status"] = "success"
-                                    report["successful"] += 1
-                                except OSError as e:
-                                    print(f"  ⚠ Could not delete: {e}")
-                                    file_report["status"] = "uploaded_but_not_deleted"
-                                    report["successful"] += 1
-                            else:
-                                print(f"  ✗ Upload failed")
-                                file_report["error"] = upload_text
-                                report["failed"] += 1
-                        
-                        except Exception as e:
-                            print(f"  ✗ Error: {str(e)}")
-                            file_report["error"] = str(e)
-                            report["failed"] += 1
-                        
-                        report["files"].append(file_report)
-                        report["processed"] += 1
-                        print()
-                
-                # Generate and print final report
-                self._print_report(report)
+                    if watcher:
+                        await self._watch(watcher)
+                    else:
+                        await self._pipeline.join()
+                    
+                    if self._report["total_files_found"] == 0:
+                        print("\nNo screenshots or recordings found.")
+                finally:
+                    if watcher:
+                        watcher.stop()
+                    await self._pipeline.stop()
+                    # Generate and print final report
+                    self._print_report(self._report)
+
+
+class _FileJob:
+    """State carried by one file through the pipeline stages."""
+    
+    def __init__(self, record):
+        self.record = record
+        self.filepath = record.path
+        self.filename = os.path.basename(record.path)
+        self.file_report = {"original_name": self.filename, "type": record.file_type, "status": "failed"}
+        # Every local path this job has claimed in AgentClient._in_flight
+        self.claimed = [record.path]
+        self.year = None
+        self.month = None
+        self.media_type = None
+        self.folder_id = None
+        self.nbytes = 0
 
 if __name__ == "__main__":
     import asyncio
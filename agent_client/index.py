@@ -0,0 +1,85 @@
+import time
+import sqlite3
+import threading
+from file_hash import hash_file
+
+
+class ProcessedIndex:
+    """
+    Durable record of files that have already been uploaded.
+
+    Files are identified by (device, inode, size, mtime), which survives the
+    rename done after analysis, plus an optional content hash that also
+    catches byte-identical copies. Backed by SQLite in WAL mode so lookups are
+    indexed and memory use doesn't grow with the number of processed files.
+    """
+
+    def __init__(self, db_path="processed_index.db", use_content_hash=False):
+        self.db_path = db_path
+        self.use_content_hash = use_content_hash
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed (
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                content_hash TEXT,
+                path TEXT,
+                processed_at REAL NOT NULL,
+                PRIMARY KEY (device, inode, size, mtime)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS processed_content_hash "
+            "ON processed (content_hash) WHERE content_hash IS NOT NULL"
+        )
+
+    def contains(self, record):
+        """Returns True if the file described by record has already been processed."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM processed WHERE device=? AND inode=? AND size=? AND mtime=?",
+                (record.device, record.inode, record.size, record.mtime),
+            ).fetchone()
+        if row:
+            return True
+
+        if self.use_content_hash:
+            try:
+                content_hash = hash_file(record.path)
+            except OSError:
+                return False
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT 1 FROM processed WHERE content_hash=? LIMIT 1",
+                    (content_hash,),
+                ).fetchone()
+            return row is not None
+        return False
+
+    def add(self, record):
+        """Records a file as processed. Safe to call from worker threads."""
+        content_hash = None
+        if self.use_content_hash:
+            try:
+                content_hash = hash_file(record.path)
+            except OSError:
+                pass
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO processed "
+                "(device, inode, size, mtime, content_hash, path, processed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (record.device, record.inode, record.size, record.mtime,
+                 content_hash, record.path, time.time()),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,129 @@
+import asyncio
+
+
+class ByteBudget:
+    """
+    Caps the total size of files in flight through the pipeline.
+    A single file larger than the limit is still admitted once nothing else
+    is in flight, so oversized recordings can't deadlock the pipeline.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, nbytes):
+        if not self.limit:
+            return
+        async with self._cond:
+            await self._cond.wait_for(
+                lambda: self.in_use == 0 or self.in_use + nbytes <= self.limit
+            )
+            self.in_use += nbytes
+
+    async def release(self, nbytes):
+        if not self.limit:
+            return
+        async with self._cond:
+            self.in_use -= nbytes
+            self._cond.notify_all()
+
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    handler is an async callable taking a job and returning True to pass the
+    job on to the next stage or False to drop it (finished or failed).
+    With batch_size set, handler instead takes a list of up to batch_size
+    jobs that were already waiting and returns a list of outcomes (True,
+    False or an Exception) in the same order.
+    """
+
+    def __init__(self, name, handler, concurrency=1, batch_size=None):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.batch_size = batch_size
+
+
+class Pipeline:
+    """
+    Runs jobs through a sequence of stages joined by bounded queues.
+    Each stage has its own worker count, so a slow stage (e.g. inference)
+    overlaps with the others instead of blocking them.
+    """
+
+    def __init__(self, stages, on_done, queue_size=8, byte_limit=0):
+        self.stages = stages
+        self.on_done = on_done
+        self.budget = ByteBudget(byte_limit)
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+        self._tasks = []
+
+    def start(self):
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.concurrency):
+                self._tasks.append(asyncio.create_task(self._stage_worker(index)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def put(self, job, nbytes=0):
+        """Admits a job, waiting for byte budget and space in the first queue."""
+        await self.budget.acquire(nbytes)
+        job.nbytes = nbytes
+        await self.queues[0].put(job)
+
+    async def join(self):
+        """Waits until every admitted job has left the pipeline."""
+        # Jobs only move forward, so draining the queues in order is enough
+        for queue in self.queues:
+            await queue.join()
+
+    async def _finish(self, job, error=None):
+        try:
+            await self.on_done(job, error)
+        finally:
+            await self.budget.release(job.nbytes)
+
+    async def _run_handler(self, stage, jobs):
+        """Runs a stage handler and returns one outcome per job."""
+        try:
+            if stage.batch_size:
+                return await stage.handler(jobs)
+            return [await stage.handler(jobs[0])]
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return [e] * len(jobs)
+
+    async def _stage_worker(self, index):
+        stage = self.stages[index]
+        queue = self.queues[index]
+        is_last = index == len(self.stages) - 1
+        while True:
+            jobs = [await queue.get()]
+            # Batched stages take whatever else is already waiting, without
+            # holding the first job back for a fuller batch
+            while stage.batch_size and len(jobs) < stage.batch_size:
+                try:
+                    jobs.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                outcomes = await self._run_handler(stage, jobs)
+                for job, outcome in zip(jobs, outcomes):
+                    if isinstance(outcome, Exception):
+                        await self._finish(job, outcome)
+                    elif outcome and not is_last:
+                        await self.queues[index + 1].put(job)
+                    else:
+                        await self._finish(job)
+            finally:
+                for _ in jobs:
+                    queue.task_done()
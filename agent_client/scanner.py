@@ -1,54 +1,134 @@
 import os
 import time
+import asyncio
+import threading
+from collections import namedtuple
 from datetime import datetime
 
+# Compact per-file record produced by the scanner. Carries the stat data
+# gathered during the scan so the client never has to stat the file again.
+FileRecord = namedtuple("FileRecord", ["path", "file_type", "size", "mtime", "inode", "device"])
+
 class Scanner:
-    def __init__(self, watch_directory):
+    def __init__(self, watch_directory, index=None):
         self.watch_directory = watch_directory
-        self.processed_files = set()
+        # Optional ProcessedIndex; without one every matching file is returned
+        self.index = index
 
     def scan(self):
         """
         Scans the directory for screenshots and screen recordings.
         Only processes files explicitly named 'screenshot' or 'screen-capture' (case-insensitive).
-        Returns a list of (filepath, file_type) tuples where file_type is 'image' or 'video'.
+        Returns a list of FileRecord tuples where file_type is 'image' or 'video'.
+        """
+        return list(self.iter_scan())
+
+    def iter_scan(self, stop_event=None):
+        """
+        Lazily yields FileRecord tuples as matching files are found, so callers
+        can start processing before the listing finishes.
+        Stops early when stop_event (a threading.Event) is set.
         """
-        found_files = []
         if not os.path.exists(self.watch_directory):
             print(f"Warning: Directory {self.watch_directory} does not exist.")
-            return found_files
-
-        for filename in os.listdir(self.watch_directory):
-            filepath = os.path.join(self.watch_directory, filename)
-            
-            # Skip directories and already processed files
-            if os.path.isdir(filepath) or filepath in self.processed_files:
-                continue
-            
-            lower_name = filename.lower()
-            file_type = None
-            
-            # Check if filename contains 'screenshot' or 'screen-capture' (case-insensitive)
-            is_screenshot = 'screenshot' in lower_name or 'screen shot' in lower_name
-            is_screen_capture = 'screen-capture' in lower_name or 'screen_capture' in lower_name
-            
-            if not (is_screenshot or is_screen_capture):
-                continue
-            
-            # Check for image extensions
-            if lower_name.endswith(('.png', '.jpg', '.jpeg')):
-                file_type = 'image'
-            # Check for video extensions (screen recordings)
-            elif lower_name.endswith(('.mov', '.mp4', '.mkv', '.avi', '.webm')):
-                file_type = 'video'
-            
-            if file_type:
-                found_files.append((filepath, file_type))
+            return
+
+        with os.scandir(self.watch_directory) as entries:
+            for entry in entries:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                
+                # Filter on the name first so non-matching entries cost no syscalls
+                file_type = self.classify(entry.name)
+                if not file_type:
+                    continue
+                
+                try:
+                    # is_file() uses the cached d_type; stat() is cached on the entry
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    # Entry disappeared between listing and stat
+                    continue
+                
+                record = self.make_record(entry.path, file_type, st, inode=entry.inode())
+                if not self.is_processed(record):
+                    yield record
+
+    async def ascan(self):
+        """
+        Async version of iter_scan() for use inside the client's event loop.
+        The directory listing runs in a worker thread one entry at a time;
+        cancelling the consumer stops the listing.
+        """
+        loop = asyncio.get_running_loop()
+        stop_event = threading.Event()
+        records = self.iter_scan(stop_event)
+        try:
+            while True:
+                record = await loop.run_in_executor(None, next, records, None)
+                if record is None:
+                    return
+                yield record
+        finally:
+            stop_event.set()
+
+    def record_for(self, filepath):
+        """Builds a FileRecord for a single path (used by watch mode). Returns None if it doesn't match."""
+        file_type = self.classify(os.path.basename(filepath))
+        if not file_type:
+            return None
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        return self.make_record(filepath, file_type, st)
+
+    @staticmethod
+    def make_record(filepath, file_type, st, inode=None):
+        """Builds a FileRecord from an os.stat_result (or DirEntry.stat())."""
+        return FileRecord(
+            path=filepath,
+            file_type=file_type,
+            size=st.st_size,
+            mtime=st.st_mtime,
+            inode=inode if inode is not None else st.st_ino,
+            device=st.st_dev,
+        )
+
+    def is_processed(self, record):
+        return self.index is not None and self.index.contains(record)
+
+    def classify(self, filename):
+        """
+        Returns 'image' or 'video' if the filename looks like a screenshot or
+        screen recording, otherwise None.
+        """
+        lower_name = filename.lower()
+        
+        # Skip hidden files (macOS writes screenshots to a dotfile before renaming)
+        if lower_name.startswith('.'):
+            return None
+        
+        # Check if filename contains 'screenshot' or 'screen-capture' (case-insensitive)
+        is_screenshot = 'screenshot' in lower_name or 'screen shot' in lower_name
+        is_screen_capture = 'screen-capture' in lower_name or 'screen_capture' in lower_name
+        
+        if not (is_screenshot or is_screen_capture):
+            return None
         
-        return found_files
+        # Check for image extensions
+        if lower_name.endswith(('.png', '.jpg', '.jpeg')):
+            return 'image'
+        # Check for video extensions (screen recordings)
+        if lower_name.endswith(('.mov', '.mp4', '.mkv', '.avi', '.webm')):
+            return 'video'
+        return None
 
-    def mark_processed(self, filepath):
-        self.processed_files.add(filepath)
+    def mark_processed(self, record):
+        if self.index is not None:
+            self.index.add(record)
 
 if __name__ == "__main__":
     # Test scanner
@@ -0,0 +1,110 @@
+import os
+import sys
+import asyncio
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+
+
+class _ScreenshotEventHandler(FileSystemEventHandler):
+    """Forwards create/move events from the observer thread to the event loop."""
+
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.dest_path)
+
+
+class Watcher:
+    """
+    Watches a directory for new screenshots and screen recordings.
+    Uses native filesystem events when available and falls back to polling
+    for filesystems that don't deliver them (network mounts, some containers).
+    """
+
+    def __init__(self, scanner, use_polling=False, poll_interval=2.0, settle_seconds=0.25):
+        self.scanner = scanner
+        self.use_polling = use_polling
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.observer = None
+        self._loop = None
+        self._queue = None
+        self._pending = set()
+        self._tasks = set()
+
+    def start(self):
+        """Starts the observer thread. Must be called from the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        handler = _ScreenshotEventHandler(self)
+
+        if not self.use_polling:
+            try:
+                self.observer = Observer()
+                self.observer.schedule(handler, self.scanner.watch_directory, recursive=False)
+                self.observer.start()
+                return
+            except OSError as e:
+                sys.stderr.write(f"Native file events unavailable ({e}), falling back to polling.\n")
+
+        self.observer = PollingObserver(timeout=self.poll_interval)
+        self.observer.schedule(handler, self.scanner.watch_directory, recursive=False)
+        self.observer.start()
+
+    def stop(self):
+        """Stops the observer thread and any pending settle checks."""
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    def notify(self, filepath):
+        """Called from the observer thread for every created or moved-in file."""
+        if self.scanner.classify(os.path.basename(filepath)):
+            self._loop.call_soon_threadsafe(self._schedule, filepath)
+
+    def _schedule(self, filepath):
+        if filepath in self._pending:
+            return
+        self._pending.add(filepath)
+        task = self._loop.create_task(self._settle(filepath))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _settle(self, filepath):
+        """Waits until the file stops growing before handing it to the pipeline."""
+        # stat calls can block on network mounts, so they run in the default
+        # thread pool instead of on the loop that drives the MCP session
+        try:
+            last_size = -1
+            while True:
+                try:
+                    size = await self._loop.run_in_executor(None, os.path.getsize, filepath)
+                except OSError:
+                    # File vanished (renamed or deleted) before it settled
+                    return
+                if size > 0 and size == last_size:
+                    break
+                last_size = size
+                await asyncio.sleep(self.settle_seconds)
+
+            record = await self._loop.run_in_executor(None, self.scanner.record_for, filepath)
+            if record:
+                await self._queue.put(record)
+        finally:
+            self._pending.discard(filepath)
+
+    async def events(self):
+        """Yields FileRecord tuples as new files settle."""
+        while True:
+            yield await self._queue.get()
@@ -0,0 +1,10 @@
+import hashlib
+
+
+def hash_file(filepath, chunk_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file, read in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,248 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache of analyze_image results.
+
+    Entries are keyed by the file's SHA-256 plus the model name and prompt
+    version, so renamed, re-copied or retried files never hit the model twice
+    while a model or prompt change invalidates old answers. Results live in
+    SQLite with least-recently-used eviction once max_entries is exceeded;
+    a small in-memory LRU in front answers repeat lookups without touching
+    the database.
+
+    Content hashes are memoized by file identity (device, inode, size,
+    mtime in ns), so a file that was hashed before isn't read again.
+    """
+
+    def __init__(self, db_path="analysis_cache.db", max_entries=50000, memory_entries=1024):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._hashes = OrderedDict()
+        # Keys served from memory whose last_used hasn't been written back yet
+        self._touched = set()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysis (
+                content_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                name TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (content_hash, model, prompt_version)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS analysis_last_used ON analysis (last_used)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (device, inode, size, mtime_ns)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS file_hashes_created ON file_hashes (created)")
+        self._hash_count = self._conn.execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0]
+        # Approximate entry count; recounted exactly only when it passes max_entries
+        self._count = self._conn.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+
+    def get_cached(self, key):
+        """Memory-only lookup, cheap enough to run on the event loop."""
+        with self._lock:
+            name = self._memory.get(key)
+            if name is not None:
+                self._memory.move_to_end(key)
+                self._touched.add(key)
+            return name
+
+    def get(self, content_hash, model, prompt_version):
+        """Returns the cached filename stem, or None."""
+        key = (content_hash, model, prompt_version)
+        name = self.get_cached(key)
+        if name is not None:
+            return name
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name FROM analysis WHERE content_hash=? AND model=? AND prompt_version=?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE analysis SET last_used=? WHERE content_hash=? AND model=? AND prompt_version=?",
+                (time.time(), *key),
+            )
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, content_hash, model, prompt_version, name):
+        """Stores a result and evicts the least recently used entries beyond max_entries."""
+        key = (content_hash, model, prompt_version)
+        now = time.time()
+        with self._lock:
+            self._flush_touched(now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis (content_hash, model, prompt_version, name, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (*key, name, now),
+            )
+            self._count += 1
+            self._remember(key, name)
+            self._evict()
+
+    def get_cached_hash(self, identity):
+        """Memory-only content hash lookup by (device, inode, size, mtime_ns)."""
+        with self._lock:
+            return self._hashes.get(identity)
+
+    def get_hash(self, identity):
+        """Returns the memoized content hash of a file identity, or None."""
+        content_hash = self.get_cached_hash(identity)
+        if content_hash is not None:
+            return content_hash
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash FROM file_hashes WHERE device=? AND inode=? AND size=? AND mtime_ns=?",
+                identity,
+            ).fetchone()
+            if row is None:
+                return None
+            self._remember_hash(identity, row[0])
+            return row[0]
+
+    def put_hash(self, identity, content_hash):
+        """Memoizes a file's content hash, evicting the oldest beyond max_entries."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (device, inode, size, mtime_ns, content_hash, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (*identity, content_hash, time.time()),
+            )
+            self._hash_count += 1
+            self._remember_hash(identity, content_hash)
+            if self.max_entries and self._hash_count > self.max_entries:
+                # Evict a little extra so we don't run this on every insert
+                excess = self._hash_count - self.max_entries + self.max_entries // 20
+                self._conn.execute(
+                    "DELETE FROM file_hashes WHERE (device, inode, size, mtime_ns) IN "
+                    "(SELECT device, inode, size, mtime_ns FROM file_hashes ORDER BY created LIMIT ?)",
+                    (excess,),
+                )
+                self._hash_count = self._conn.execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0]
+                self._hashes.clear()
+
+    def _remember_hash(self, identity, content_hash):
+        self._hashes[identity] = content_hash
+        self._hashes.move_to_end(identity)
+        while len(self._hashes) > self.memory_entries:
+            self._hashes.popitem(last=False)
+
+    def _remember(self, key, name):
+        self._memory[key] = name
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self, now):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE analysis SET last_used=? WHERE content_hash=? AND model=? AND prompt_version=?",
+                [(now, *key) for key in self._touched],
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        if not self.max_entries or self._count <= self.max_entries:
+            return
+        self._count = self._conn.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess > 0:
+            # Evict a little extra so we don't run this on every insert
+            excess += self.max_entries // 20
+            self._conn.execute(
+                "DELETE FROM analysis WHERE (content_hash, model, prompt_version) IN "
+                "(SELECT content_hash, model, prompt_version FROM analysis ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self._count -= excess
+            self._memory.clear()
+
+    def export(self, path):
+        """Writes every entry to a JSON Lines file. Returns the number of entries."""
+        with self._lock:
+            self._flush_touched(time.time())
+            rows = self._conn.execute(
+                "SELECT content_hash, model, prompt_version, name, last_used FROM analysis"
+            ).fetchall()
+        with open(path, "w") as f:
+            for content_hash, model, prompt_version, name, last_used in rows:
+                f.write(json.dumps({
+                    "content_hash": content_hash,
+                    "model": model,
+                    "prompt_version": prompt_version,
+                    "name": name,
+                    "last_used": last_used,
+                }) + "\n")
+        return len(rows)
+
+    def import_(self, path):
+        """Merges entries from a JSON Lines export. Returns the number of entries read."""
+        entries = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                entries.append((
+                    item["content_hash"], item["model"], item["prompt_version"],
+                    item["name"], item.get("last_used", time.time()),
+                ))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO analysis (content_hash, model, prompt_version, name, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                entries,
+            )
+            self._count += len(entries)
+            self._evict()
+        return len(entries)
+
+    def close(self):
+        with self._lock:
+            self._flush_touched(time.time())
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    # Usage: python -m gdrive_server.analysis_cache export|import <file.jsonl>
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "import"):
+        print("Usage: python -m gdrive_server.analysis_cache export|import <file.jsonl>")
+        sys.exit(1)
+    cache = AnalysisCache(os.getenv("ANALYSIS_CACHE_PATH", "analysis_cache.db"), max_entries=0)
+    if sys.argv[1] == "export":
+        print(f"Exported {cache.export(sys.argv[2])} entries to {sys.argv[2]}")
+    else:
+        print(f"Imported {cache.import_(sys.argv[2])} entries from {sys.argv[2]}")
+    cache.close()
@@ -0,0 +1,83 @@
+import asyncio
+
+
+class InferenceBatcher:
+    """
+    Collects analysis requests that arrive within a short window and
+    dispatches them as a group.
+
+    In "concurrent" mode the group is sent as individual requests, at most
+    parallel_slots at a time (match Ollama's OLLAMA_NUM_PARALLEL), so a burst
+    of screenshots fills every inference slot. In "multi" mode the group is
+    sent as one multi-image prompt; if the answer doesn't contain one name
+    per image the group falls back to concurrent requests.
+    """
+
+    def __init__(self, infer_one, infer_many=None, window=0.05, max_batch=8,
+                 parallel_slots=4, mode="concurrent"):
+        self.infer_one = infer_one
+        self.infer_many = infer_many
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.mode = mode
+        self._slots = asyncio.Semaphore(max(1, parallel_slots))
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, item):
+        """Queues one item for inference and waits for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch or not self.window:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch):
+        # Callers that gave up (cancelled) don't need an answer
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+
+        if self.mode == "multi" and self.infer_many and len(batch) > 1:
+            try:
+                async with self._slots:
+                    results = await self.infer_many([item for item, _ in batch])
+                if len(results) == len(batch):
+                    for (_, future), result in zip(batch, results):
+                        if not future.done():
+                            future.set_result(result)
+                    return
+            except Exception:
+                # Fall back to one request per image below
+                pass
+
+        await asyncio.gather(*(self._run_one(item, future) for item, future in batch))
+
+    async def _run_one(self, item, future):
+        async with self._slots:
+            if future.done():
+                return
+            try:
+                result = await self.infer_one(item)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                return
+        if not future.done():
+            future.set_result(result)
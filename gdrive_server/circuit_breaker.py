@@ -0,0 +1,97 @@
+import sys
+import asyncio
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service the circuit breaker considers down."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service so callers fail fast instead of each
+    waiting for a connection error or timeout.
+
+    After failure_threshold consecutive failures (as judged by is_failure)
+    the circuit opens: call() raises CircuitOpenError immediately. While
+    open, probe() is awaited every probe_interval seconds in the
+    background. Once it returns True the circuit is half-open: a single
+    trial call goes through (others still fail fast) and closes the
+    circuit if it succeeds, or reopens it if it fails.
+    """
+
+    def __init__(self, probe, is_failure, failure_threshold=5, probe_interval=10.0, name="service"):
+        self.probe = probe
+        self.is_failure = is_failure
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.name = name
+        # "closed", "open" or "half_open"
+        self.state = "closed"
+        self._failures = 0
+        self._trial_running = False
+        self._probe_task = None
+
+    @property
+    def is_open(self):
+        """True while call() would fail fast."""
+        return self.state == "open" or (self.state == "half_open" and self._trial_running)
+
+    async def call(self, func, *args):
+        """Awaits func(*args) unless the circuit is open, recording the outcome."""
+        if self.is_open:
+            raise CircuitOpenError(f"{self.name} unavailable (circuit {self.state.replace('_', '-')})")
+        trial = self.state == "half_open"
+        if trial:
+            self._trial_running = True
+        try:
+            result = await func(*args)
+        except Exception as e:
+            if self.failure_threshold and self.is_failure(e):
+                self._record_failure(e, trial)
+            elif trial:
+                # The service answered, just not successfully for this request
+                self._close()
+            raise
+        finally:
+            if trial:
+                self._trial_running = False
+        if trial:
+            self._close()
+        self._failures = 0
+        return result
+
+    def _record_failure(self, error, trial=False):
+        self._failures += 1
+        if trial:
+            sys.stderr.write(f"{self.name} trial request failed ({error or type(error).__name__}), circuit reopened\n")
+        elif self.state != "closed" or self._failures < self.failure_threshold:
+            return
+        else:
+            sys.stderr.write(
+                f"{self.name} failed {self._failures} times in a row ({error or type(error).__name__}), "
+                f"failing fast until it recovers\n"
+            )
+        self.state = "open"
+        self._probe_task = asyncio.get_running_loop().create_task(self._probe_until_half_open())
+
+    def _close(self):
+        if self.state == "half_open":
+            self.state = "closed"
+            self._failures = 0
+            sys.stderr.write(f"{self.name} trial request succeeded, circuit closed\n")
+
+    async def _probe_until_half_open(self):
+        while self.state == "open":
+            await asyncio.sleep(self.probe_interval)
+            try:
+                recovered = await self.probe()
+            except Exception:
+                recovered = False
+            if recovered:
+                self.state = "half_open"
+                sys.stderr.write(f"{self.name} is reachable again, letting a trial request through\n")
+
+    def close(self):
+        """Stops background probing."""
+        if self._probe_task:
+            self._probe_task.cancel()
@@ -1,20 +1,34 @@
 import os
+import json
 import datetime
+import threading
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
 class DriveAPI:
-    def __init__(self, credentials_path='credentials.json', token_path='token.json'):
+    def __init__(self, credentials_path='credentials.json', token_path='token.json',
+                 folder_cache_path='folder_cache.json'):
         self.credentials_path = credentials_path
         self.token_path = token_path
-        self.service = None
+        self.folder_cache_path = folder_cache_path
+        self.creds = None
+        # googleapiclient's HTTP transport is not thread-safe, so each thread
+        # that talks to Drive gets its own service object
+        self._local = threading.local()
+        # Maps folder paths like "2025/11/images" to Drive folder IDs
+        self.folder_cache = {}
+        self._folder_lock = threading.Lock()
         self.authenticate()
+        self.load_folder_cache()
 
     def authenticate(self):
         """Authenticates the user and creates the Drive service."""
@@ -41,13 +55,23 @@ class DriveAPI:
             with open(self.token_path, 'w') as token:
                 token.write(creds.to_json())
 
-        self.service = build('drive', 'v3', credentials=creds)
+        self.creds = creds
+        self._local.service = build('drive', 'v3', credentials=creds)
+
+    @property
+    def service(self):
+        """The Drive service for the calling thread."""
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = build('drive', 'v3', credentials=self.creds, cache_discovery=False)
+            self._local.service = service
+        return service
 
     def create_folder(self, name, parent_id=None):
         """Creates a folder in Google Drive."""
         file_metadata = {
             'name': name,
-            'mimeType': 'application/vnd.google-apps.folder'
+            'mimeType': FOLDER_MIME_TYPE
         }
         if parent_id:
             file_metadata['parents'] = [parent_id]
@@ -57,7 +81,7 @@ class DriveAPI:
 
     def find_folder(self, name, parent_id=None):
         """Finds a folder by name and parent ID."""
-        query = f"mimeType='application/vnd.google-apps.folder' and name='{name}' and trashed=false"
+        query = f"mimeType='{FOLDER_MIME_TYPE}' and name='{name}' and trashed=false"
         if parent_id:
             query += f" and '{parent_id}' in parents"
         
@@ -69,6 +93,92 @@ class DriveAPI:
             return None
         return items[0]['id']
 
+    def load_folder_cache(self):
+        """Loads the folder path → ID map persisted by a previous run."""
+        if not self.folder_cache_path or not os.path.exists(self.folder_cache_path):
+            return
+        try:
+            with open(self.folder_cache_path) as f:
+                self.folder_cache = json.load(f)
+        except (OSError, ValueError):
+            self.folder_cache = {}
+
+    def save_folder_cache(self):
+        """Persists the folder path → ID map for the next run."""
+        if not self.folder_cache_path:
+            return
+        tmp_path = self.folder_cache_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.folder_cache, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.folder_cache_path)
+
+    def warm_folder_cache(self):
+        """
+        Rebuilds the folder cache from a single paginated listing of every
+        folder visible to the agent (the drive.file scope only exposes
+        folders the agent created). Returns the number of cached paths.
+        """
+        folders = {}
+        page_token = None
+        while True:
+            results = self.service.files().list(
+                q=f"mimeType='{FOLDER_MIME_TYPE}' and trashed=false",
+                spaces='drive',
+                fields='nextPageToken, files(id, name, parents)',
+                pageSize=1000,
+                pageToken=page_token).execute()
+            for item in results.get('files', []):
+                parents = item.get('parents') or []
+                folders[item['id']] = (item['name'], parents[0] if parents else None)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+        cache = {}
+        for folder_id in folders:
+            # Walk up to the top-most agent-owned folder to build the path
+            names = []
+            current = folder_id
+            while current in folders and len(names) <= 3:
+                name, parent = folders[current]
+                names.append(name)
+                current = parent
+            # Only year, year/month and year/month/media_type paths are routed
+            if len(names) <= 3:
+                cache.setdefault('/'.join(reversed(names)), folder_id)
+
+        with self._folder_lock:
+            self.folder_cache = cache
+            self.save_folder_cache()
+        return len(cache)
+
+    def invalidate_folder(self, folder_id):
+        """
+        Drops a stale folder ID (and everything below it) from the cache.
+        Returns the (year, month, media_type) path it was cached under, or None.
+        """
+        with self._folder_lock:
+            path = next((p for p, fid in self.folder_cache.items() if fid == folder_id), None)
+            if path is None:
+                return None
+            for cached in list(self.folder_cache):
+                if cached == path or cached.startswith(path + '/'):
+                    del self.folder_cache[cached]
+            self.save_folder_cache()
+        parts = path.split('/')
+        return tuple(parts) if len(parts) == 3 else None
+
+    def _ensure_folder(self, path, name, parent_id):
+        """Returns the ID for a cached folder path, looking it up or creating it on a miss."""
+        folder_id = self.folder_cache.get(path)
+        if folder_id:
+            return folder_id, False
+        folder_id = self.find_folder(name, parent_id=parent_id)
+        if not folder_id:
+            folder_id = self.create_folder(name, parent_id=parent_id)
+        self.folder_cache[path] = folder_id
+        return folder_id, True
+
     def ensure_folder_structure(self, year, month, media_type="images"):
         """Ensures the /year/month/media_type folder structure exists."""
         # Normalize media type
@@ -76,25 +186,46 @@ class DriveAPI:
         if media_type not in ["images", "videos"]:
             media_type = "images"
         
-        # Check/Create Year Folder
-        year_id = self.find_folder(str(year))
-        if not year_id:
-            year_id = self.create_folder(str(year))
+        year_path = str(year)
+        month_path = f"{year}/{month}"
+        media_path = f"{year}/{month}/{media_type}"
         
-        # Check/Create Month Folder inside Year
-        month_id = self.find_folder(str(month), parent_id=year_id)
-        if not month_id:
-            month_id = self.create_folder(str(month), parent_id=year_id)
+        # Hot path: the full route is cached, no Drive round trips
+        media_id = self.folder_cache.get(media_path)
+        if media_id:
+            return media_id
         
-        # Check/Create Media Type Folder inside Month
-        media_id = self.find_folder(media_type, parent_id=month_id)
-        if not media_id:
-            media_id = self.create_folder(media_type, parent_id=month_id)
+        with self._folder_lock:
+            # Check/Create Year Folder
+            year_id, year_new = self._ensure_folder(year_path, str(year), None)
+            # Check/Create Month Folder inside Year
+            month_id, month_new = self._ensure_folder(month_path, str(month), year_id)
+            # Check/Create Media Type Folder inside Month
+            media_id, media_new = self._ensure_folder(media_path, media_type, month_id)
+            
+            if year_new or month_new or media_new:
+                self.save_folder_cache()
             
         return media_id
 
     def upload_file(self, file_path, folder_id):
-        """Uploads a file to the specified folder."""
+        """
+        Uploads a file to the specified folder.
+        If Drive reports the folder missing (404), the cached route is
+        revalidated and the upload retried once.
+        """
+        try:
+            return self._upload_file(file_path, folder_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            route = self.invalidate_folder(folder_id)
+            if route is None:
+                raise
+            new_folder_id = self.ensure_folder_structure(*route)
+            return self._upload_file(file_path, new_folder_id)
+
+    def _upload_file(self, file_path, folder_id):
         file_name = os.path.basename(file_path)
         file_metadata = {
             'name': file_name,
@@ -0,0 +1,212 @@
+import io
+import re
+import sys
+import math
+import base64
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+# Pillow format names for the supported VISION_IMAGE_FORMAT values
+IMAGE_FORMATS = {"jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP", "png": "PNG"}
+
+
+def prepare_image(image_path, max_edge=1024, image_format="jpeg", quality=85):
+    """
+    Decodes an image, shrinks it so its longest edge is at most max_edge and
+    re-encodes it in a compact format for the vision model.
+    Returns the encoded bytes, or the original file bytes when max_edge is 0
+    or the image can't be decoded by Pillow.
+    """
+    if not max_edge:
+        with open(image_path, "rb") as f:
+            return f.read()
+
+    try:
+        with Image.open(image_path) as img:
+            # Let the JPEG decoder skip pixels we'd throw away anyway
+            img.draft("RGB", (max_edge, max_edge))
+            img.load()
+            img = flatten_alpha(img)
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            return encode_image(img, image_format, quality)
+    except Exception as e:
+        sys.stderr.write(f"Image preprocessing failed for {image_path}, sending original: {e}\n")
+        with open(image_path, "rb") as f:
+            return f.read()
+
+
+def as_base64(func, *args):
+    """
+    Calls func(*args) and returns its bytes base64-encoded (None stays None).
+    Top-level so it can run in a worker process together with the encoding.
+    """
+    data = func(*args)
+    if data is None:
+        return None
+    return base64.standard_b64encode(data).decode("utf-8")
+
+
+def image_size(source):
+    """
+    Returns (width, height) of an image given as a path or bytes, or None.
+    Only the header is parsed, so a truncated prefix of the data is enough.
+    """
+    try:
+        with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def flatten_alpha(img):
+    """Converts to RGB, compositing transparent screenshots onto white."""
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def encode_image(img, image_format="jpeg", quality=85):
+    """Encodes a Pillow image to bytes in the given format."""
+    pil_format = IMAGE_FORMATS.get(image_format.lower(), "JPEG")
+    buffer = io.BytesIO()
+    if pil_format == "PNG":
+        img.save(buffer, format=pil_format, optimize=True)
+    else:
+        img.save(buffer, format=pil_format, quality=quality)
+    return buffer.getvalue()
+
+
+def extract_video_frame(video_path, offset=1.0, max_edge=1024, image_format="jpeg", timeout=30):
+    """
+    Grabs a single frame at offset seconds and returns it as encoded image
+    bytes, or None if extraction fails.
+
+    -ss before -i makes ffmpeg seek in the container instead of decoding
+    from the start, -frames:v 1 stops after one frame, the scale filter
+    downsizes during extraction and the image is streamed back over stdout,
+    so the cost doesn't grow with the length of the recording.
+    """
+    frame = _run_frame_extraction(video_path, offset, max_edge, image_format, timeout)
+    if not frame and offset:
+        # Recordings shorter than the offset produce no frame; take the first one
+        frame = _run_frame_extraction(video_path, 0, max_edge, image_format, timeout)
+    return frame
+
+
+def _run_frame_extraction(video_path, offset, max_edge, image_format, timeout):
+    codec = "png" if image_format.lower() == "png" else "mjpeg"
+    cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        "-ss", str(offset),
+        "-i", video_path,
+        "-an", "-sn", "-dn",
+        "-frames:v", "1",
+    ]
+    if max_edge:
+        cmd += ["-vf", f"scale=w='min(iw,{max_edge})':h='min(ih,{max_edge})':force_original_aspect_ratio=decrease"]
+    cmd += ["-f", "image2pipe", "-c:v", codec]
+    if codec == "mjpeg":
+        cmd += ["-q:v", "3"]
+    cmd += ["-"]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+    except Exception as e:
+        sys.stderr.write(f"Error extracting video frame: {e}\n")
+        return None
+    if result.returncode != 0 or not result.stdout:
+        return None
+    return result.stdout
+
+
+def probe_duration(video_path, timeout=15):
+    """Returns the duration of a video in seconds, or None if it can't be determined."""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", video_path],
+            capture_output=True, text=True, timeout=timeout,
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError, subprocess.SubprocessError):
+        pass
+
+    # No ffprobe: read the "Duration: HH:MM:SS.xx" line ffmpeg prints for its input
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-i", video_path],
+            capture_output=True, text=True, timeout=timeout,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def make_contact_sheet(video_path, frame_count=4, max_edge=1024, image_format="jpeg", quality=85):
+    """
+    Samples frame_count frames spread evenly over the video and tiles them
+    into one grid image no larger than max_edge, so a single inference call
+    sees the whole recording. Returns (encoded image bytes, number of
+    frames in it), or None if no frame could be extracted. Fewer frames
+    than requested end up in the sheet if the duration can't be probed
+    (the first frame only) or some frames fail to decode.
+    """
+    duration = probe_duration(video_path)
+    if not duration or frame_count <= 1:
+        frame = extract_video_frame(video_path, 0, max_edge, image_format)
+        return (frame, 1) if frame else None
+
+    columns = math.ceil(math.sqrt(frame_count))
+    rows = math.ceil(frame_count / columns)
+    # Each tile only needs to be as big as its share of the final sheet
+    tile_edge = max(64, (max_edge or 1024) // columns)
+    offsets = [duration * (i + 0.5) / frame_count for i in range(frame_count)]
+
+    with ThreadPoolExecutor(max_workers=frame_count) as pool:
+        frames = list(pool.map(
+            lambda offset: _run_frame_extraction(video_path, round(offset, 3), tile_edge, "jpeg", 30),
+            offsets,
+        ))
+
+    tiles = []
+    for frame in frames:
+        if not frame:
+            continue
+        with Image.open(io.BytesIO(frame)) as img:
+            tiles.append(img.convert("RGB"))
+    if not tiles:
+        return None
+    if len(tiles) == 1:
+        return encode_image(tiles[0], image_format, quality), 1
+
+    tile_width = max(tile.width for tile in tiles)
+    tile_height = max(tile.height for tile in tiles)
+    rows = math.ceil(len(tiles) / columns)
+    sheet = Image.new("RGB", (columns * tile_width, rows * tile_height), (0, 0, 0))
+    for index, tile in enumerate(tiles):
+        x = (index % columns) * tile_width + (tile_width - tile.width) // 2
+        y = (index // columns) * tile_height + (tile_height - tile.height) // 2
+        sheet.paste(tile, (x, y))
+    if max_edge:
+        sheet.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    return encode_image(sheet, image_format, quality), len(tiles)
+
+
+def contact_sheet_base64(*args):
+    """make_contact_sheet() with the image base64-encoded, for worker processes."""
+    sheet = make_contact_sheet(*args)
+    if sheet is None:
+        return None
+    data, frame_count = sheet
+    return base64.standard_b64encode(data).decode("utf-8"), frame_count
@@ -0,0 +1,167 @@
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import platform
+from PIL import Image, ImageDraw, ImageFont
+from .media import encode_image
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only has the small bitmap font
+        return ImageFont.load_default()
+
+
+def _login_screen(draw):
+    draw.rectangle((0, 0, 1280, 64), fill=(33, 37, 41))
+    draw.text((24, 16), "Acme Cloud", font=_font(28), fill="white")
+    draw.rectangle((440, 160, 840, 620), fill="white", outline=(210, 210, 210), width=2)
+    draw.text((560, 190), "Sign in", font=_font(40), fill=(33, 37, 41))
+    for y, label in ((290, "Email address"), (400, "Password")):
+        draw.text((480, y), label, font=_font(22), fill=(80, 80, 80))
+        draw.rectangle((480, y + 32, 800, y + 80), outline=(160, 160, 160), width=2)
+    draw.rounded_rectangle((480, 530, 800, 585), radius=8, fill=(13, 110, 253))
+    draw.text((600, 543), "Log in", font=_font(26), fill="white")
+
+
+def _error_dialog(draw):
+    draw.rectangle((0, 0, 1280, 800), fill=(200, 205, 210))
+    draw.rectangle((340, 250, 940, 550), fill="white", outline=(120, 120, 120), width=2)
+    draw.rectangle((340, 250, 940, 300), fill=(220, 53, 69))
+    draw.text((360, 260), "Error", font=_font(28), fill="white")
+    draw.text((370, 340), "Connection failed.", font=_font(30), fill=(33, 37, 41))
+    draw.text((370, 390), "Check your network settings and try again.", font=_font(22), fill=(80, 80, 80))
+    draw.rounded_rectangle((800, 480, 910, 525), radius=6, fill=(108, 117, 125))
+    draw.text((838, 488), "OK", font=_font(24), fill="white")
+
+
+def _sales_dashboard(draw):
+    draw.rectangle((0, 0, 240, 800), fill=(44, 62, 80))
+    for y, item in enumerate(("Overview", "Sales", "Customers", "Reports")):
+        draw.text((30, 120 + y * 60), item, font=_font(24), fill="white")
+    draw.text((290, 40), "Sales Dashboard", font=_font(40), fill=(33, 37, 41))
+    draw.line((320, 700, 1220, 700), fill=(60, 60, 60), width=3)
+    draw.line((320, 700, 320, 180), fill=(60, 60, 60), width=3)
+    for index, height in enumerate((220, 340, 280, 460, 390, 500)):
+        x = 360 + index * 140
+        draw.rectangle((x, 700 - height, x + 90, 700), fill=(40, 167, 69))
+        draw.text((x + 20, 710), f"Q{index % 4 + 1}", font=_font(22), fill=(60, 60, 60))
+
+
+SAMPLE_SCREENS = (_login_screen, _error_dialog, _sales_dashboard)
+
+
+def synthetic_samples(max_edge=1024, image_format="jpeg", quality=85):
+    """
+    Draws the built-in benchmark screenshots (a login form, an error dialog
+    and a dashboard) and returns them encoded like real images would be.
+    """
+    samples = []
+    for draw_screen in SAMPLE_SCREENS:
+        img = Image.new("RGB", (1280, 800), (248, 249, 250))
+        draw_screen(ImageDraw.Draw(img))
+        if max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        samples.append(encode_image(img, image_format, quality))
+    return samples
+
+
+def is_vision_model(info):
+    """True if an /api/show response describes a model that accepts images."""
+    if "vision" in (info.get("capabilities") or []):
+        return True
+    # Older Ollama versions: multimodal models ship a CLIP projector
+    families = (info.get("details") or {}).get("families") or []
+    return "projector_info" in info or any(family in ("clip", "mllama") for family in families)
+
+
+def parameter_count(model):
+    """Parameter count from an /api/tags entry ("7B", "1.4B", "500M"), or 0."""
+    size = (model.get("details") or {}).get("parameter_size", "")
+    match = re.match(r"^\s*([\d.]+)\s*([KMBT])", size.upper())
+    if not match:
+        return 0
+    return float(match.group(1)) * {"K": 1e3, "M": 1e6, "B": 1e9, "T": 1e12}[match.group(2)]
+
+
+def capability_rank(model):
+    """Sort key ranking models by capability: parameter count, then file size."""
+    return (parameter_count(model), model.get("size", 0))
+
+
+def selection_fingerprint(models, endpoints, slo_seconds):
+    """
+    Identifies the setup a selection was made for: this machine, the Ollama
+    endpoints, the installed vision models (by digest) and the latency target.
+    """
+    data = {
+        "machine": [platform.node(), platform.machine(), platform.processor(), os.cpu_count()],
+        "endpoints": sorted(endpoints),
+        "models": sorted((model["name"], model.get("digest", "")) for model in models),
+        "slo_seconds": slo_seconds,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_selection(path):
+    """Returns the persisted selection dict, or None."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_selection(path, selection):
+    try:
+        with open(path, "w") as f:
+            json.dump(selection, f, indent=2)
+    except OSError as e:
+        sys.stderr.write(f"Failed to save model selection: {e}\n")
+
+
+async def benchmark_models(models, run_sample, samples, slo_seconds, is_valid):
+    """
+    Benchmarks models from the most to the least capable and returns
+    (chosen model name, results). The first model whose slowest sample
+    stays within slo_seconds and that names most samples validly wins; if
+    none does, the fastest one with valid answers is chosen.
+
+    run_sample(model, sample) returns the model's answer for one sample.
+    The first sample is run once untimed so model load isn't measured.
+    """
+    results = {}
+    for model in sorted(models, key=capability_rank, reverse=True):
+        name = model["name"]
+        try:
+            await run_sample(name, samples[0])
+            latencies = []
+            valid = 0
+            for sample in samples:
+                start = time.monotonic()
+                answer = await run_sample(name, sample)
+                latencies.append(time.monotonic() - start)
+                valid += bool(is_valid(answer))
+        except Exception as e:
+            results[name] = {"error": str(e) or type(e).__name__}
+            continue
+        results[name] = {
+            "max_seconds": round(max(latencies), 3),
+            "mean_seconds": round(sum(latencies) / len(latencies), 3),
+            "valid_answers": valid,
+            "samples": len(samples),
+        }
+        if max(latencies) <= slo_seconds and valid * 2 >= len(samples):
+            return name, results
+
+    measured = [(r["max_seconds"], r["valid_answers"] * 2 < r["samples"], name)
+                for name, r in results.items() if "error" not in r]
+    if not measured:
+        return None, results
+    # Prefer models with valid answers, then the fastest
+    return min(measured, key=lambda m: (m[1], m[0]))[2], results
@@ -0,0 +1,329 @@
+import re
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import httpx
+from collections import defaultdict, deque
+
+# Bytes of an ImageFile read per body chunk; a multiple of 3 so each chunk
+# base64-encodes without padding
+IMAGE_CHUNK_SIZE = 3 * 64 * 1024
+
+
+class OllamaError(Exception):
+    """Raised when the Ollama API answers with a non-200 status."""
+
+    def __init__(self, status_code):
+        super().__init__(f"Ollama API returned {status_code}")
+        self.status_code = status_code
+
+
+class ImageFile:
+    """
+    An image sent straight from disk. It is base64-encoded chunk by chunk
+    while the request body streams out, so neither the file nor its
+    encoding is ever held in memory whole.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+
+async def iter_base64(path, chunk_size=IMAGE_CHUNK_SIZE):
+    """Yields the base64 encoding of a file in chunks."""
+    loop = asyncio.get_running_loop()
+    with open(path, "rb") as f:
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, chunk_size)
+            if not chunk:
+                break
+            yield base64.standard_b64encode(chunk)
+
+
+async def iter_json_body(payload):
+    """
+    Yields payload serialized as JSON, with every ImageFile in "images"
+    streamed from disk as a base64 string.
+    """
+    files = {}
+    images = []
+    for index, image in enumerate(payload.get("images") or []):
+        if isinstance(image, ImageFile):
+            token = f"@@image-file-{index}@@"
+            files[token] = image.path
+            image = token
+        images.append(image)
+
+    text = json.dumps(dict(payload, images=images))
+    # Odd parts are the placeholder tokens, even parts the JSON around them
+    for index, part in enumerate(re.split(r'"(@@image-file-\d+@@)"', text)):
+        if index % 2 == 0:
+            yield part.encode("utf-8")
+            continue
+        yield b'"'
+        async for chunk in iter_base64(files[part]):
+            yield chunk
+        yield b'"'
+
+
+def request_body(payload):
+    """httpx request arguments for payload, streaming the body if it references ImageFiles."""
+    if any(isinstance(image, ImageFile) for image in payload.get("images") or []):
+        return {"content": iter_json_body(payload), "headers": {"Content-Type": "application/json"}}
+    return {"json": payload}
+
+
+class OllamaClient:
+    """
+    Async client for the Ollama HTTP API backed by one shared keep-alive
+    connection pool, so concurrent tool calls reuse TCP connections instead
+    of opening a new one per request.
+    """
+
+    def __init__(self, base_url, timeout=120.0, max_connections=8):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client = None
+
+    @property
+    def client(self):
+        # Created lazily so it binds to the server's running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60.0,
+                ),
+            )
+        return self._client
+
+    async def generate(self, payload):
+        """POSTs to /api/generate and returns the decoded JSON response."""
+        response = await self.client.post("/api/generate", **request_body(payload))
+        if response.status_code != 200:
+            raise OllamaError(response.status_code)
+        return response.json()
+
+    async def load_model(self, model, keep_alive=None, timeout=600.0):
+        """
+        Loads a model into memory without generating anything (an empty
+        prompt makes Ollama just load it). Also refreshes its keep-alive.
+        """
+        payload = {"model": model, "stream": False}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        response = await self.client.post("/api/generate", json=payload, timeout=timeout)
+        if response.status_code != 200:
+            raise OllamaError(response.status_code)
+        return response.json()
+
+    async def list_models(self):
+        """Returns the installed models (the "models" list of /api/tags)."""
+        response = await self.client.get("/api/tags")
+        if response.status_code != 200:
+            raise OllamaError(response.status_code)
+        return response.json().get("models", [])
+
+    async def show_model(self, model):
+        """Returns a model's details from /api/show (capabilities, families, ...)."""
+        response = await self.client.post("/api/show", json={"model": model})
+        if response.status_code != 200:
+            raise OllamaError(response.status_code)
+        return response.json()
+
+    async def generate_stream(self, payload, is_complete=None):
+        """
+        Streams /api/generate and returns a dict shaped like the non-streaming
+        response. If is_complete(text) returns True for the text received so
+        far, the stream is closed early, which makes Ollama stop generating.
+        """
+        payload = dict(payload, stream=True)
+        text = ""
+        result = {}
+        async with self.client.stream("POST", "/api/generate", **request_body(payload)) as response:
+            if response.status_code != 200:
+                raise OllamaError(response.status_code)
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                text += chunk.get("response", "")
+                if chunk.get("done"):
+                    result = chunk
+                    break
+                if is_complete and is_complete(text):
+                    result = {"done": False, "done_reason": "client_stop"}
+                    break
+        result["response"] = text
+        return result
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class Endpoint:
+    """One Ollama server of an OllamaPool and its routing state."""
+
+    def __init__(self, client):
+        self.client = client
+        self.outstanding = 0
+        self.healthy = True
+
+    @property
+    def base_url(self):
+        return self.client.base_url
+
+
+class OllamaPool:
+    """
+    Spreads requests over several Ollama servers with the OllamaClient
+    interface.
+
+    Each request goes to the healthy endpoint with the fewest outstanding
+    requests. Endpoints that refuse connections are skipped until a
+    background health check (/api/tags) sees them again. A request still
+    running after the hedge_percentile of recent latencies for its model is
+    duplicated to a second endpoint and whichever answers first wins, so one slow
+    node doesn't set the tail latency.
+    """
+
+    def __init__(self, base_urls, timeout=120.0, max_connections=8, hedge_percentile=95,
+                 hedge_min_samples=20, health_interval=15.0):
+        self.endpoints = [Endpoint(OllamaClient(url, timeout, max_connections)) for url in base_urls]
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.health_interval = health_interval
+        # Recent latencies per model: a small and a large model in a cascade
+        # have very different latencies, so they don't share a hedge delay
+        self._latencies = defaultdict(lambda: deque(maxlen=200))
+
+    @property
+    def base_urls(self):
+        return [endpoint.base_url for endpoint in self.endpoints]
+
+    def _pick(self, exclude=None):
+        candidates = [e for e in self.endpoints if e is not exclude]
+        healthy = [e for e in candidates if e.healthy]
+        if healthy:
+            candidates = healthy
+        if not candidates:
+            return None
+        least = min(e.outstanding for e in candidates)
+        return random.choice([e for e in candidates if e.outstanding == least])
+
+    def hedge_delay(self, model):
+        """Seconds after which a request for model is hedged, or None while hedging is off."""
+        if not self.hedge_percentile or len(self.endpoints) < 2:
+            return None
+        if len(self._latencies[model]) < self.hedge_min_samples:
+            return None
+        latencies = sorted(self._latencies[model])
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))
+        return latencies[index]
+
+    async def _run(self, endpoint, method, payload, *args):
+        endpoint.outstanding += 1
+        start = time.monotonic()
+        try:
+            result = await getattr(endpoint.client, method)(payload, *args)
+        except httpx.TransportError:
+            endpoint.healthy = False
+            raise
+        finally:
+            endpoint.outstanding -= 1
+        self._latencies[payload.get("model")].append(time.monotonic() - start)
+        return result
+
+    async def _call(self, method, payload, *args):
+        primary = self._pick()
+        try:
+            return await self._hedged(primary, method, payload, *args)
+        except httpx.ConnectError:
+            # The endpoint is down (and now marked unhealthy): fail over once
+            fallback = self._pick(exclude=primary)
+            if fallback is None or not fallback.healthy:
+                raise
+            return await self._run(fallback, method, payload, *args)
+
+    async def _hedged(self, primary, method, payload, *args):
+        first = asyncio.ensure_future(self._run(primary, method, payload, *args))
+        delay = self.hedge_delay(payload.get("model"))
+        if delay is None:
+            return await first
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            secondary = None if done else self._pick(exclude=primary)
+            if secondary is not None and secondary.healthy:
+                tasks.add(asyncio.ensure_future(self._run(secondary, method, payload, *args)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            # The losing request is cancelled, which closes its connection
+            # and makes that Ollama stop generating
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def generate(self, payload):
+        return await self._call("generate", payload)
+
+    async def generate_stream(self, payload, is_complete=None):
+        return await self._call("generate_stream", payload, is_complete)
+
+    async def list_models(self):
+        """Models installed on one healthy endpoint (all are assumed to match)."""
+        return await self._pick().client.list_models()
+
+    async def show_model(self, model):
+        return await self._pick().client.show_model(model)
+
+    async def load_model(self, model, keep_alive=None, timeout=600.0):
+        """Loads the model on every endpoint. Fails only if no endpoint could load it."""
+        results = await asyncio.gather(
+            *(endpoint.client.load_model(model, keep_alive, timeout) for endpoint in self.endpoints),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if len(errors) == len(results):
+            raise errors[0]
+        return results
+
+    async def check_health(self):
+        """Probes every endpoint once and updates its healthy flag."""
+        async def probe(endpoint):
+            try:
+                response = await endpoint.client.client.get("/api/tags", timeout=5.0)
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            if healthy != endpoint.healthy:
+                sys.stderr.write(f"Ollama at {endpoint.base_url} is {'up' if healthy else 'down'}\n")
+            endpoint.healthy = healthy
+        await asyncio.gather(*(probe(endpoint) for endpoint in self.endpoints))
+
+    async def run_health_checks(self):
+        """Checks endpoint health every health_interval seconds until cancelled."""
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_interval)
+
+    async def aclose(self):
+        for endpoint in self.endpoints:
+            await endpoint.client.aclose()
@@ -1,64 +1,701 @@
 from mcp.server.fastmcp import FastMCP
+from googleapiclient.errors import HttpError
 from .drive_api import DriveAPI
+from .ollama_client import OllamaPool, OllamaError, ImageFile
+from .media import prepare_image, extract_video_frame, contact_sheet_base64, as_base64, image_size
+from .analysis_cache import AnalysisCache
+from .batcher import InferenceBatcher
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .telemetry import InferenceMetrics
+from .model_selection import (
+    synthetic_samples, is_vision_model, selection_fingerprint, load_selection, save_selection, benchmark_models,
+)
+from file_hash import hash_file
 import os
+import re
 import sys
+import json
 import base64
-import requests
-import subprocess
-import tempfile
+import asyncio
+import logging
+import multiprocessing
+import httpx
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Tuple
 
 # Ollama configuration
 OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434")
+# Several inference boxes, comma-separated; overrides OLLAMA_API_URL
+OLLAMA_API_URLS = [
+    url.strip() for url in os.getenv("OLLAMA_API_URLS", "").split(",") if url.strip()
+] or [OLLAMA_API_URL]
+# With several endpoints, a request slower than this percentile of recent
+# latencies is also sent to a second endpoint (0 = never hedge)
+OLLAMA_HEDGE_PERCENTILE = float(os.getenv("OLLAMA_HEDGE_PERCENTILE", "95"))
+# Seconds between health checks of every endpoint
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))
 VISION_MODEL = os.getenv("VISION_MODEL", "llava:7b")
+# VISION_MODEL=auto benchmarks the installed vision models on built-in
+# samples and uses the most capable one answering within the latency
+# target. The choice is persisted and reused until the machine, the
+# endpoints or the installed models change.
+VISION_MODEL_AUTO = VISION_MODEL.strip().lower() == "auto"
+VISION_LATENCY_SLO_MS = float(os.getenv("VISION_LATENCY_SLO_MS", "3000"))
+MODEL_SELECTION_PATH = os.getenv("MODEL_SELECTION_PATH", "model_selection.json")
+if VISION_MODEL_AUTO:
+    # Use the last selection until the startup benchmark confirms or replaces it
+    VISION_MODEL = (load_selection(MODEL_SELECTION_PATH) or {}).get("model") or "llava:7b"
+# Optional cascade of models, fastest first ("moondream:latest,llava:7b").
+# Each image goes to the first model; the next one is only asked when the
+# answer is empty, generic or falls back to the original name.
+VISION_MODEL_CASCADE = [
+    model.strip() for model in os.getenv("VISION_MODEL_CASCADE", "").split(",")
+    if model.strip() and not VISION_MODEL_AUTO
+] or [VISION_MODEL]
+# Identifies the model setup in cached results
+VISION_MODEL_KEY = ",".join(VISION_MODEL_CASCADE)
+# Images are downscaled to this longest edge and re-encoded before inference
+# (VISION_MAX_EDGE=0 sends the original file)
+VISION_MAX_EDGE = int(os.getenv("VISION_MAX_EDGE", "1024"))
+VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "jpeg")
+VISION_IMAGE_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", "85"))
+# Persistent cache of analysis results keyed by file content + model + prompt
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE", "1").lower() not in ["0", "false", "no"]
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "analysis_cache.db")
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
+
+# Prompt used to ask the vision model for a filename. Bump PROMPT_VERSION
+# whenever the prompt changes so cached answers from the old one are ignored.
+FILENAME_PROMPT = (
+    "Analyze this screenshot and generate a short, descriptive filename (no extension). "
+    "Requirements: 2-4 words, all lowercase, use underscores for spaces only, "
+    "alphanumeric and underscore only [a-z0-9_]. "
+    "Examples: login_screen, payment_form, error_message, dashboard_view. "
+    "Return ONLY the filename, nothing else."
+)
+PROMPT_VERSION = "1"
+
+# Answers made only of these words (and numbers) say nothing about the
+# content and are escalated to the next model of the cascade
+GENERIC_NAME_WORDS = {
+    "screenshot", "screen", "shot", "capture", "image", "picture", "photo", "video",
+    "recording", "record", "file", "filename", "untitled", "unknown", "desktop",
+    "window", "app", "application", "page", "view", "frame", "grid", "frames",
+}
+
+# Used for screen recordings analyzed from a contact sheet of several frames
+VIDEO_FILENAME_PROMPT = (
+    "This image is a grid of {count} frames sampled from one screen recording, "
+    "in order left to right, top to bottom. Generate a short, descriptive filename "
+    "(no extension) for the whole recording. "
+    "Requirements: 2-4 words, all lowercase, use underscores for spaces only, "
+    "alphanumeric and underscore only [a-z0-9_]. "
+    "Examples: checkout_flow_demo, settings_walkthrough, bug_reproduction. "
+    "Return ONLY the filename, nothing else."
+)
+
+# Used in "multi" batch mode: several images in one request, one name per line
+MULTI_FILENAME_PROMPT = (
+    "You are given {count} screenshots, in order. For each one, generate a short, "
+    "descriptive filename (no extension): 2-4 words, all lowercase, underscores for spaces, "
+    "only [a-z0-9_]. Answer with exactly {count} lines in the form '<number>. <filename>', "
+    "for example '1. login_screen'. Return nothing else."
+)
+
+# Bounded decoding for filename answers: a small token cap, a newline stop
+# sequence and, when streaming, a client-side cut-off once a name is complete
+FILENAME_MAX_TOKENS = int(os.getenv("FILENAME_MAX_TOKENS", "16"))
+FILENAME_MAX_CHARS = 64
+FILENAME_STREAM = os.getenv("FILENAME_STREAM", "1").lower() not in ["0", "false", "no"]
+# Constrain the answer to {"filename": "..."} with Ollama's structured outputs
+FILENAME_JSON_FORMAT = os.getenv("FILENAME_JSON_FORMAT", "0").lower() in ["1", "true", "yes"]
+FILENAME_SCHEMA = {
+    "type": "object",
+    "properties": {"filename": {"type": "string", "maxLength": FILENAME_MAX_CHARS}},
+    "required": ["filename"],
+}
+
+# Micro-batching of bursts: requests arriving within the window are grouped
+# and sent either as parallel requests (at most OLLAMA_NUM_PARALLEL at once)
+# or, in "multi" mode, as one multi-image prompt
+ANALYSIS_BATCH_WINDOW_MS = float(os.getenv("ANALYSIS_BATCH_WINDOW_MS", "50"))
+ANALYSIS_BATCH_MAX = int(os.getenv("ANALYSIS_BATCH_MAX", "8"))
+ANALYSIS_BATCH_MODE = os.getenv("ANALYSIS_BATCH_MODE", "concurrent").lower()
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+
+# How long Ollama keeps the model resident after a request ("30m", "1h",
+# seconds, or "-1" for forever). The server also refreshes it periodically
+# so the model stays loaded for as long as the agent is running.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Preload VISION_MODEL in the background when the server starts
+WARMUP_MODEL = os.getenv("WARMUP_MODEL", "1").lower() not in ["0", "false", "no"]
+
+# Videos are analyzed from a single frame taken this many seconds in
+# (the first frame of a screen recording is often black)
+VIDEO_FRAME_OFFSET = float(os.getenv("VIDEO_FRAME_OFFSET", "1.0"))
+# Number of frames sampled across a recording and tiled into one contact
+# sheet for a single inference call (1 = analyze only the frame above)
+VIDEO_KEYFRAMES = int(os.getenv("VIDEO_KEYFRAMES", "4"))
+
+# After this many consecutive connection errors, timeouts or 5xx answers,
+# analysis returns the fallback name immediately until a background probe
+# (every CIRCUIT_PROBE_INTERVAL seconds) sees Ollama again (0 = disabled)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_PROBE_INTERVAL = float(os.getenv("CIRCUIT_PROBE_INTERVAL", "10"))
+
+# Size of the keep-alive connection pool to Ollama
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "8"))
+
+# Max items of a batch tool call processed concurrently
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+# Threads for blocking work (Drive API calls, file reads, ffmpeg)
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "8"))
+# Worker processes for CPU-bound media work (hashing, decode/resize, base64,
+# ffmpeg frame extraction) so a backlog uses every core (0 = use threads)
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", str(os.cpu_count() or 1)))
+
+# httpx logs every request at INFO level; keep the server's stderr readable
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def parse_duration(value: str):
+    """Parses an Ollama keep_alive value into seconds (None = forever or unknown)."""
+    value = value.strip().lower()
+    units = {"s": 1, "m": 60, "h": 3600}
+    try:
+        if value and value[-1] in units:
+            seconds = float(value[:-1]) * units[value[-1]]
+        else:
+            seconds = float(value)
+    except ValueError:
+        return None
+    return seconds if seconds > 0 else None
+
+
+# Readiness of the vision model, reported by the inference_status tool
+model_status = {"state": "disabled", "model": VISION_MODEL_KEY, "load_seconds": None, "error": None}
+
+
+async def load_models():
+    """Loads every model of the cascade (or refreshes its keep-alive)."""
+    for model in VISION_MODEL_CASCADE:
+        await ollama.load_model(model, keep_alive=OLLAMA_KEEP_ALIVE)
+
+
+async def warm_up_model():
+    """
+    Selects the model (VISION_MODEL=auto) and loads the vision model(s),
+    then keeps refreshing their keep-alive while the server runs.
+    """
+    model_status.update(state="loading", error=None)
+    start = time.monotonic()
+    try:
+        if VISION_MODEL_AUTO:
+            await auto_select_model()
+        if WARMUP_MODEL:
+            await load_models()
+        model_status.update(state="ready", load_seconds=round(time.monotonic() - start, 2))
+    except Exception as e:
+        model_status.update(state="error", error=str(e) or type(e).__name__)
+        sys.stderr.write(f"Failed to preload {VISION_MODEL_KEY}: {model_status['error']}\n")
+    
+    interval = parse_duration(OLLAMA_KEEP_ALIVE)
+    if interval is None or not WARMUP_MODEL:
+        return
+    while True:
+        await asyncio.sleep(interval / 2)
+        try:
+            await load_models()
+            model_status.update(state="ready", error=None)
+        except Exception as e:
+            model_status.update(state="error", error=str(e) or type(e).__name__)
+
+
+@asynccontextmanager
+async def server_lifespan(server):
+    """Starts model warm-up and health checks with the server and closes the Ollama pool on shutdown."""
+    warmup_task = asyncio.create_task(warm_up_model()) if WARMUP_MODEL or VISION_MODEL_AUTO else None
+    health_task = asyncio.create_task(ollama.run_health_checks())
+    try:
+        yield {}
+    finally:
+        if warmup_task:
+            warmup_task.cancel()
+        health_task.cancel()
+        inference_breaker.close()
+        await ollama.aclose()
+        if media_pool:
+            media_pool.shutdown(wait=False, cancel_futures=True)
+
 
 # Initialize FastMCP server
-mcp = FastMCP("Google Drive MCP Server")
+mcp = FastMCP("Google Drive MCP Server", lifespan=server_lifespan)
+
+blocking_pool = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+metrics = InferenceMetrics()
+ollama = OllamaPool(
+    OLLAMA_API_URLS,
+    timeout=120.0,
+    max_connections=OLLAMA_MAX_CONNECTIONS,
+    hedge_percentile=OLLAMA_HEDGE_PERCENTILE,
+    health_interval=OLLAMA_HEALTH_INTERVAL,
+)
 
-# Initialize Drive API
-try:
-    drive = DriveAPI()
-except Exception as e:
-    sys.stderr.write(f"Failed to initialize Drive API: {e}\n")
-    drive = None
+# Set up by start_services() in the server process only
+drive = None
+analysis_cache = None
+media_pool = None
 
 
-def extract_video_frame(video_path: str) -> str:
+def start_media_pool():
+    """Starts the media worker processes with the platform's default start method, or returns None."""
+    if MEDIA_WORKERS <= 0:
+        return None
+    context = multiprocessing.get_context()
+    try:
+        pool = ProcessPoolExecutor(max_workers=MEDIA_WORKERS, mp_context=context)
+        if context.get_start_method() == "fork":
+            # A fork pool starts all its workers on the first submit; do it
+            # now while no other threads exist yet
+            pool.submit(int).result()
+        return pool
+    except Exception as e:
+        sys.stderr.write(f"Failed to start media worker processes, using threads: {e}\n")
+        return None
+
+
+def start_services():
     """
-    Extracts the first keyframe from a video file.
-    Returns path to temporary PNG file, or None if extraction fails.
+    Starts the media workers, logs in to Drive and opens the analysis cache.
+    Runs in the server process only: spawned media workers import this
+    module too and must not repeat it.
     """
+    global drive, analysis_cache, media_pool
+    media_pool = start_media_pool()
+    
     try:
-        # Create temporary file for frame
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-            tmp_path = tmp.name
-        
-        # Use ffmpeg to extract first frame
-        cmd = [
-            "ffmpeg",
-            "-i", video_path,
-            "-vf", "select=eq(n\\,0)",
-            "-q:v", "2",
-            "-y",
-            tmp_path
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, timeout=30)
-        
-        if result.returncode == 0 and os.path.exists(tmp_path):
-            return tmp_path
-        else:
-            return None
+        drive = DriveAPI(folder_cache_path=os.getenv("FOLDER_CACHE_PATH", "folder_cache.json"))
     except Exception as e:
-        sys.stderr.write(f"Error extracting video frame: {e}\n")
+        sys.stderr.write(f"Failed to initialize Drive API: {e}\n")
+        drive = None
+    
+    if ANALYSIS_CACHE_ENABLED:
+        try:
+            analysis_cache = AnalysisCache(ANALYSIS_CACHE_PATH, max_entries=ANALYSIS_CACHE_MAX_ENTRIES)
+        except Exception as e:
+            sys.stderr.write(f"Failed to open analysis cache, continuing without it: {e}\n")
+    
+    # Warm the folder cache with one listing so routing needs no Drive round trips
+    if drive:
+        try:
+            drive.warm_folder_cache()
+        except Exception as e:
+            sys.stderr.write(f"Failed to warm folder cache, using persisted copy: {e}\n")
+
+
+async def run_blocking(func, *args):
+    """Runs a blocking call in the server's thread pool without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_pool, func, *args)
+
+
+async def run_media(func, *args):
+    """
+    Runs CPU-bound media work in the worker processes. func must be a
+    top-level function. Falls back to the thread pool if the process pool
+    is disabled or a worker died.
+    """
+    global media_pool
+    if media_pool is None:
+        return await run_blocking(func, *args)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(media_pool, func, *args)
+    except BrokenProcessPool:
+        sys.stderr.write("Media worker process died, falling back to threads\n")
+        media_pool = None
+        return await run_blocking(func, *args)
+
+
+def filename_options(max_tokens: int, stop: List[str]) -> Dict:
+    """Ollama decoding options for filename requests."""
+    return {"temperature": 0.3, "num_predict": max_tokens, "stop": stop}
+
+
+def filename_complete(text: str) -> bool:
+    """True once a streamed answer holds a whole filename (or is clearly too long)."""
+    if len(text) > FILENAME_MAX_CHARS:
+        return True
+    if FILENAME_JSON_FORMAT:
+        return "}" in text
+    stripped = text.lstrip()
+    return bool(stripped) and ("\n" in stripped or "." in stripped)
+
+
+def extract_filename(answer: str) -> str:
+    """Pulls the filename out of a (possibly cut-off) model answer."""
+    if FILENAME_JSON_FORMAT:
+        try:
+            return str(json.loads(answer).get("filename", ""))
+        except (ValueError, AttributeError):
+            match = re.search(r'"filename"\s*:\s*"([^"]*)', answer)
+            return match.group(1) if match else ""
+    # Only the first line/sentence is the name; anything after is chatter
+    return re.split(r"[\n.]", answer.strip(), maxsplit=1)[0]
+
+
+def filename_payload(image_data, prompt: str, model: str) -> Dict:
+    """Ollama generate payload asking one model for one image's filename."""
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "images": [image_data],
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": filename_options(FILENAME_MAX_TOKENS, [] if FILENAME_JSON_FORMAT else ["\n"]),
+    }
+    if FILENAME_JSON_FORMAT:
+        payload["format"] = FILENAME_SCHEMA
+    return payload
+
+
+async def generate_filename(payload: Dict) -> Dict:
+    """Sends a filename payload to Ollama, streamed if FILENAME_STREAM is set."""
+    if FILENAME_STREAM:
+        return await ollama.generate_stream(payload, filename_complete)
+    return await ollama.generate(payload)
+
+
+async def infer_filename(request) -> str:
+    """
+    Asks a vision model for a filename for one (image_data, prompt, model)
+    request. Returns the raw answer.
+    """
+    image_data, prompt, model = request
+    payload = filename_payload(image_data, prompt, model)
+    start = time.monotonic()
+    try:
+        result = await inference_breaker.call(generate_filename, payload)
+    except (OllamaError, httpx.HTTPError):
+        metrics.record_error(model)
+        raise
+    metrics.record_call(
+        model, result, time.monotonic() - start, payload_size(image_data), [payload_image_size(image_data)]
+    )
+    return extract_filename(result.get("response", ""))
+
+
+async def infer_filenames(requests) -> List[str]:
+    """
+    Asks for one filename per image in a single multi-image request.
+    Returns an empty list if the answer doesn't name every image, or if
+    the group mixes in requests with their own prompt (video contact sheets)
+    or for different models of the cascade.
+    """
+    models = {model for _, _, model in requests}
+    if len(models) != 1 or any(prompt != FILENAME_PROMPT for _, prompt, _ in requests):
+        return []
+    images = [image_data for image_data, _, _ in requests]
+    payload = {
+        "model": models.pop(),
+        "prompt": MULTI_FILENAME_PROMPT.format(count=len(images)),
+        "images": images,
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        # One short line per image
+        "options": filename_options(FILENAME_MAX_TOKENS * len(images), []),
+    }
+    start = time.monotonic()
+    try:
+        result = await inference_breaker.call(ollama.generate, payload)
+    except (OllamaError, httpx.HTTPError):
+        metrics.record_error(payload["model"])
+        raise
+    metrics.record_call(
+        payload["model"], result, time.monotonic() - start,
+        sum(payload_size(image) for image in images), [payload_image_size(image) for image in images],
+    )
+    return parse_numbered_names(result.get("response", ""), len(images))
+
+
+def parse_numbered_names(text: str, count: int) -> List[str]:
+    """Parses '1. name' lines into a list of count names, or [] if any are missing."""
+    names = {}
+    for line in text.splitlines():
+        match = re.match(r"^\s*(\d+)\s*[\.\):\-]\s*(.+)$", line)
+        if match:
+            names.setdefault(int(match.group(1)), match.group(2).strip())
+    if sorted(names) != list(range(1, count + 1)):
+        return []
+    return [names[i] for i in range(1, count + 1)]
+
+
+def payload_size(image_data) -> int:
+    """Bytes an image adds to a request body (base64-encoded)."""
+    if isinstance(image_data, ImageFile):
+        return os.path.getsize(image_data.path) * 4 // 3
+    return len(image_data)
+
+
+def payload_image_size(image_data):
+    """(width, height) of the image sent to the model, read from its header."""
+    if isinstance(image_data, ImageFile):
+        return image_size(image_data.path)
+    # 64K base64 characters hold the header of any usual PNG/JPEG/WebP
+    return image_size(base64.b64decode(image_data[:65536]))
+
+
+def is_inference_failure(error: Exception) -> bool:
+    """True for errors that mean Ollama is down or overloaded (not e.g. a missing model)."""
+    if isinstance(error, OllamaError):
+        return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, httpx.TransportError)
+
+
+async def inference_available() -> bool:
+    """Recovery probe for the circuit breaker: is any Ollama endpoint answering?"""
+    await ollama.check_health()
+    return any(endpoint.healthy for endpoint in ollama.endpoints)
+
+
+inference_breaker = CircuitBreaker(
+    inference_available,
+    is_inference_failure,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    probe_interval=CIRCUIT_PROBE_INTERVAL,
+    name="Ollama",
+)
+
+inference_batcher = InferenceBatcher(
+    infer_filename,
+    infer_many=infer_filenames,
+    window=ANALYSIS_BATCH_WINDOW_MS / 1000.0,
+    max_batch=ANALYSIS_BATCH_MAX,
+    # Every endpoint runs OLLAMA_NUM_PARALLEL requests at once
+    parallel_slots=OLLAMA_NUM_PARALLEL * len(OLLAMA_API_URLS),
+    mode=ANALYSIS_BATCH_MODE,
+)
+
+
+async def read_image_base64(image_path: str) -> str:
+    """Reads an image, downscales/re-encodes it for the model and returns it base64-encoded."""
+    return await run_media(
+        as_base64, prepare_image, image_path, VISION_MAX_EDGE, VISION_IMAGE_FORMAT, VISION_IMAGE_QUALITY
+    )
+
+
+def clean_filename(suggested_name: str) -> str:
+    """Reduces text to a safe filename stem; may return "" if nothing usable is left."""
+    # Aggressive sanitization
+    suggested_name = suggested_name.strip().lower()
+    # Keep only a-z, 0-9, space, underscore, hyphen
+    suggested_name = re.sub(r"[^a-z0-9_\-\s]", "", suggested_name)
+    # Replace hyphens and spaces with underscores
+    suggested_name = suggested_name.replace("-", "_").replace(" ", "_")
+    # Collapse multiple underscores
+    suggested_name = re.sub(r"_+", "_", suggested_name).strip("_")
+    # Remove file extension if somehow included
+    if "." in suggested_name:
+        suggested_name = suggested_name.rsplit(".", 1)[0]
+    return suggested_name
+
+
+def fallback_name(stem: str) -> str:
+    """Name used when the model gives no usable answer, derived from the original stem."""
+    return clean_filename(f"screenshot_{stem[:20]}")
+
+
+def sanitize_filename(suggested_name: str, stem: str) -> Tuple[str, bool]:
+    """
+    Turns a model answer into a safe filename stem (no extension).
+    Returns (name, fell_back); fell_back is True if the answer was unusable
+    and the name was derived from the original stem instead.
+    """
+    name = clean_filename(suggested_name)
+    if len(name) < 2:
+        return fallback_name(stem), True
+    return name, False
+
+
+def is_generic_name(suggested_name: str) -> bool:
+    """True if a sanitized name only contains generic words like screenshot_image_1."""
+    return all(word in GENERIC_NAME_WORDS or word.isdigit() for word in suggested_name.split("_"))
+
+
+async def suggest_name(image_data, prompt: str, stem: str) -> Tuple[str, bool]:
+    """
+    Runs the model cascade for one image and returns sanitize_filename()'s
+    (name, fell_back) for the chosen answer.
+    A model that fails or gives an empty, generic or fallback answer hands
+    the image to the next one. If no model does better, the last generic
+    answer is used, and only without one does the name fall back.
+    """
+    generic_name = None
+    for index, model in enumerate(VISION_MODEL_CASCADE):
+        is_last = index == len(VISION_MODEL_CASCADE) - 1
+        try:
+            # Bursts are grouped by the batcher
+            answer = await inference_batcher.submit((image_data, prompt, model))
+        except (OllamaError, httpx.HTTPError) as e:
+            if is_last and generic_name is None:
+                raise
+            sys.stderr.write(f"{model} failed: {e}\n")
+            continue
+        suggested_name, fell_back = sanitize_filename(answer, stem)
+        if fell_back:
+            continue
+        if not is_generic_name(suggested_name):
+            return suggested_name, False
+        generic_name = suggested_name
+    
+    if generic_name is not None:
+        return generic_name, False
+    return fallback_name(stem), True
+
+
+def set_vision_model(model: str):
+    """Switches analysis to a single model (used by automatic model selection)."""
+    global VISION_MODEL, VISION_MODEL_CASCADE, VISION_MODEL_KEY
+    VISION_MODEL = model
+    VISION_MODEL_CASCADE = [model]
+    VISION_MODEL_KEY = model
+    model_status["model"] = model
+
+
+async def auto_select_model(force: bool = False) -> Dict:
+    """
+    Benchmarks the installed vision models and switches to the most capable
+    one within VISION_LATENCY_SLO_MS. The persisted selection is reused
+    while its fingerprint still matches, unless force is set.
+    Returns the selection.
+    """
+    vision_models = []
+    for model in await ollama.list_models():
+        try:
+            info = await ollama.show_model(model["name"])
+        except (OllamaError, httpx.HTTPError):
+            continue
+        if is_vision_model(info):
+            vision_models.append(model)
+    if not vision_models:
+        raise RuntimeError("No vision models installed in Ollama")
+    
+    slo_seconds = VISION_LATENCY_SLO_MS / 1000.0
+    fingerprint = selection_fingerprint(vision_models, OLLAMA_API_URLS, slo_seconds)
+    saved = await run_blocking(load_selection, MODEL_SELECTION_PATH)
+    if not force and saved and saved.get("fingerprint") == fingerprint and saved.get("model"):
+        set_vision_model(saved["model"])
+        return saved
+    
+    sys.stderr.write(f"Benchmarking {len(vision_models)} vision model(s)...\n")
+    samples = [
+        base64.standard_b64encode(sample).decode("utf-8")
+        for sample in await run_media(synthetic_samples, VISION_MAX_EDGE, VISION_IMAGE_FORMAT, VISION_IMAGE_QUALITY)
+    ]
+    
+    async def run_sample(model, image_data):
+        # Called directly: a slow candidate must neither trip the circuit
+        # breaker nor show up in the production inference metrics
+        result = await generate_filename(filename_payload(image_data, FILENAME_PROMPT, model))
+        return extract_filename(result.get("response", ""))
+    
+    def is_valid(answer):
+        name, fell_back = sanitize_filename(answer, "sample")
+        return not (fell_back or is_generic_name(name))
+    
+    chosen, results = await benchmark_models(vision_models, run_sample, samples, slo_seconds, is_valid)
+    if chosen is None:
+        raise RuntimeError("No vision model answered the benchmark")
+    
+    # Free the memory of the models that weren't chosen
+    for name in results:
+        if name != chosen:
+            try:
+                await ollama.load_model(name, keep_alive=0)
+            except Exception:
+                pass
+    
+    selection = {
+        "model": chosen,
+        "fingerprint": fingerprint,
+        "slo_ms": VISION_LATENCY_SLO_MS,
+        "selected_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    await run_blocking(save_selection, MODEL_SELECTION_PATH, selection)
+    sys.stderr.write(f"Selected vision model {chosen}\n")
+    set_vision_model(chosen)
+    return selection
+
+
+# In-flight analyses by (content key, prompt version); the content key is
+# the SHA-256 with the analysis cache and the file identity without it
+analyses_in_flight: Dict[tuple, asyncio.Future] = {}
+
+
+def sheet_prompt_version(frame_count: int) -> str:
+    """Prompt version of a contact sheet with frame_count frames (one frame uses FILENAME_PROMPT)."""
+    return f"{PROMPT_VERSION}-sheet{frame_count}" if frame_count > 1 else PROMPT_VERSION
+
+
+async def analyze_content(local_path: str, is_video: bool, use_contact_sheet: bool,
+                          content_hash: str, prompt_version: str):
+    """
+    Prepares a file for the model, asks for a name and caches the answer
+    under content_hash (None when the cache is disabled).
+    Returns the name stem, "" if the model gave no usable name, or None if
+    no frame could be extracted from a video.
+    """
+    # Check if it's a video and extract frame(s) if needed
+    prompt = FILENAME_PROMPT
+    start = time.monotonic()
+    if use_contact_sheet:
+        image_data, frame_count = await run_media(
+            contact_sheet_base64, local_path, VIDEO_KEYFRAMES, VISION_MAX_EDGE,
+            VISION_IMAGE_FORMAT, VISION_IMAGE_QUALITY
+        ) or (None, 0)
+        # Describe the frames actually in the sheet, which can be fewer than
+        # requested, and cache under the prompt that was really sent
+        if frame_count > 1:
+            prompt = VIDEO_FILENAME_PROMPT.format(count=frame_count)
+        prompt_version = sheet_prompt_version(frame_count)
+    elif is_video:
+        image_data = await run_media(
+            as_base64, extract_video_frame, local_path, VIDEO_FRAME_OFFSET, VISION_MAX_EDGE, VISION_IMAGE_FORMAT
+        )
+    elif not VISION_MAX_EDGE:
+        # The original file is sent as is: stream it from disk while the
+        # request goes out instead of holding raw, base64 and JSON copies
+        image_data = ImageFile(local_path)
+    else:
+        # Read image directly
+        image_data = await read_image_base64(local_path)
+    metrics.prepare.observe(time.monotonic() - start)
+    
+    if is_video and not image_data:
         return None
+    
+    # Ask the vision model(s) for a filename
+    stem = Path(local_path).stem
+    suggested_name, fell_back = await suggest_name(image_data, prompt, stem)
+    if fell_back:
+        # Not cached, so the file is analyzed again next time; callers
+        # sharing this analysis fall back to their own file name
+        return ""
+    
+    if analysis_cache:
+        await run_blocking(analysis_cache.put, content_hash, VISION_MODEL_KEY, prompt_version, suggested_name)
+    return suggested_name
 
 
 @mcp.tool()
-def analyze_image(local_path: str) -> str:
+async def analyze_image(local_path: str) -> str:
     """
     Analyzes an image or video using Ollama vision model and suggests an appropriate filename.
-    For videos, extracts the first keyframe for analysis.
+    For videos, analyzes a contact sheet of VIDEO_KEYFRAMES frames sampled across the recording.
     
     Args:
         local_path: Absolute path to the image or video file.
@@ -69,112 +706,84 @@ def analyze_image(local_path: str) -> str:
     if not os.path.exists(local_path):
         return f"Error: File not found at {local_path}"
     
+    path_obj = Path(local_path)
+    ext = path_obj.suffix.lower()
+    
     try:
-        import re
-        
-        path_obj = Path(local_path)
-        ext = path_obj.suffix.lower()
-        
-        # Check if it's a video and extract frame if needed
-        frame_path = None
+        # Identical content analyzed before (renamed, re-copied or retried) is
+        # answered from the cache without calling the model
         is_video = ext in ['.mov', '.mp4', '.mkv', '.avi', '.webm']
-        
-        if is_video:
-            frame_path = extract_video_frame(local_path)
-            if not frame_path:
-                return f"error_video_frame_{path_obj.stem}{ext}"
-            # Read the extracted frame
-            with open(frame_path, "rb") as img_file:
-                image_data = base64.standard_b64encode(img_file.read()).decode("utf-8")
+        use_contact_sheet = is_video and VIDEO_KEYFRAMES > 1
+        # Contact sheets use a different prompt, so they are cached separately.
+        # A sheet may hold fewer frames than requested; its result is cached
+        # under the prompt actually sent, so every possible version is looked up
+        if use_contact_sheet:
+            prompt_versions = [sheet_prompt_version(count) for count in range(VIDEO_KEYFRAMES, 0, -1)]
         else:
-            # Read image directly
-            with open(local_path, "rb") as img_file:
-                image_data = base64.standard_b64encode(img_file.read()).decode("utf-8")
-        
-        # Call Ollama vision model with explicit instruction for filename
-        prompt = (
-            "Analyze this screenshot and generate a short, descriptive filename (no extension). "
-            "Requirements: 2-4 words, all lowercase, use underscores for spaces only, "
-            "alphanumeric and underscore only [a-z0-9_]. "
-            "Examples: login_screen, payment_form, error_message, dashboard_view. "
-            "Return ONLY the filename, nothing else."
-        )
+            prompt_versions = [PROMPT_VERSION]
+        prompt_version = prompt_versions[0]
         
-        payload = {
-            "model": VISION_MODEL,
-            "prompt": prompt,
-            "images": [image_data],
-            "stream": False,
-            "temperature": 0.3,
-        }
-        
-        response = requests.post(
-            f"{OLLAMA_API_URL}/api/generate",
-            json=payload,
-            timeout=120
-        )
+        st = await run_blocking(os.stat, local_path)
+        identity = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        if analysis_cache:
+            # Files hashed before (retries, repeat calls) skip the full read
+            content_hash = analysis_cache.get_cached_hash(identity)
+            if content_hash is None:
+                content_hash = await run_blocking(analysis_cache.get_hash, identity)
+            if content_hash is None:
+                content_hash = await run_media(hash_file, local_path)
+                await run_blocking(analysis_cache.put_hash, identity, content_hash)
+            content_key = content_hash
+            for version in prompt_versions:
+                cache_key = (content_hash, VISION_MODEL_KEY, version)
+                cached_name = analysis_cache.get_cached(cache_key)
+                if cached_name is None:
+                    cached_name = await run_blocking(analysis_cache.get, *cache_key)
+                if cached_name is not None:
+                    return f"{cached_name}{ext}"
+        else:
+            # Without the cache a hash would only serve coalescing but cost a
+            # full read (GBs for long recordings): identify the file instead
+            content_hash = None
+            content_key = identity
         
-        if response.status_code != 200:
-            return f"Error: Ollama API returned {response.status_code}"
+        # Ollama is known to be down: don't prepare the image just to fail
+        if inference_breaker.is_open:
+            return f"{fallback_name(path_obj.stem)}{ext}"
         
-        result = response.json()
-        suggested_name = result.get("response", "").strip()
+        # Concurrent calls for the same content (retries, and with the cache
+        # byte-identical copies) share one analysis instead of each running inference
+        flight_key = (content_key, prompt_version)
+        flight = analyses_in_flight.get(flight_key)
+        if flight is None:
+            flight = asyncio.ensure_future(
+                analyze_content(local_path, is_video, use_contact_sheet, content_hash, prompt_version)
+            )
+            analyses_in_flight[flight_key] = flight
+            flight.add_done_callback(lambda _: analyses_in_flight.pop(flight_key, None))
+        # Shielded so one caller giving up doesn't cancel it for the others
+        suggested_name = await asyncio.shield(flight)
         
+        if suggested_name is None:
+            return f"error_video_frame_{path_obj.stem}{ext}"
         if not suggested_name:
-            suggested_name = f"screenshot_{path_obj.stem[:20]}"
-        
-        # Aggressive sanitization
-        suggested_name = suggested_name.lower()
-        # Keep only a-z, 0-9, space, underscore, hyphen
-        suggested_name = re.sub(r"[^a-z0-9_\-\s]", "", suggested_name)
-        # Replace hyphens and spaces with underscores
-        suggested_name = suggested_name.replace("-", "_").replace(" ", "_")
-        # Collapse multiple underscores
-        suggested_name = re.sub(r"_+", "_", suggested_name).strip("_")
-        # Remove file extension if somehow included
-        if "." in suggested_name:
-            suggested_name = suggested_name.rsplit(".", 1)[0]
-        
-        # Final fallback
-        if not suggested_name or len(suggested_name) < 2:
-            suggested_name = f"screenshot_{path_obj.stem[:15]}"
-        
-        result = f"{suggested_name}{ext}"
-        
-        # Cleanup temporary frame file if it was created
-        if frame_path and os.path.exists(frame_path):
-            try:
-                os.remove(frame_path)
-            except:
-                pass
-        
-        return result
-        
-    except requests.exceptions.ConnectionError:
-        if frame_path and os.path.exists(frame_path):
-            try:
-                os.remove(frame_path)
-            except:
-                pass
-        return f"Error: Cannot connect to Ollama at {OLLAMA_API_URL}. Make sure Ollama is running with 'ollama serve'."
-    except requests.exceptions.Timeout:
-        if frame_path and os.path.exists(frame_path):
-            try:
-                os.remove(frame_path)
-            except:
-                pass
+            return f"{fallback_name(path_obj.stem)}{ext}"
+        return f"{suggested_name}{ext}"
+    
+    except CircuitOpenError:
+        return f"{fallback_name(path_obj.stem)}{ext}"
+    except OllamaError as e:
+        return f"Error: Ollama API returned {e.status_code}"
+    except httpx.ConnectError:
+        return f"Error: Cannot connect to Ollama at {', '.join(OLLAMA_API_URLS)}. Make sure Ollama is running with 'ollama serve'."
+    except httpx.TimeoutException:
         return "Error: Ollama request timed out."
     except Exception as e:
-        if frame_path and os.path.exists(frame_path):
-            try:
-                os.remove(frame_path)
-            except:
-                pass
         return f"Error analyzing image: {str(e)}"
 
 
 @mcp.tool()
-def upload_file(local_path: str, folder_id: str) -> str:
+async def upload_file(local_path: str, folder_id: str) -> str:
     """
     Uploads a file to Google Drive.
     
@@ -192,14 +801,18 @@ def upload_file(local_path: str, folder_id: str) -> str:
         return f"Error: File not found at {local_path}"
         
     try:
-        file_id = drive.upload_file(local_path, folder_id)
+        file_id = await run_blocking(drive.upload_file, local_path, folder_id)
         return f"Successfully uploaded file. File ID: {file_id}"
+    except HttpError as e:
+        if e.resp.status == 404:
+            return f"Error: Folder not found: {folder_id}"
+        return f"Error uploading file: {str(e)}"
     except Exception as e:
         return f"Error uploading file: {str(e)}"
 
 
 @mcp.tool()
-def ensure_folder_structure(year: int, month: int, media_type: str = "images") -> str:
+async def ensure_folder_structure(year: int, month: int, media_type: str = "images") -> str:
     """
     Ensures the /media_type/year/month folder structure exists in Google Drive.
     
@@ -215,11 +828,122 @@ def ensure_folder_structure(year: int, month: int, media_type: str = "images") -
         return "Error: Drive API not initialized."
         
     try:
-        folder_id = drive.ensure_folder_structure(year, month, media_type)
+        folder_id = await run_blocking(drive.ensure_folder_structure, year, month, media_type)
         return folder_id
     except Exception as e:
         return f"Error ensuring folder structure: {str(e)}"
 
 
+@mcp.tool()
+async def inference_status() -> str:
+    """
+    Reports whether the vision model is loaded and ready for analysis.
+    
+    Returns:
+        JSON object {"state", "model", "load_seconds", "error", "circuit"} where
+        state is "loading", "ready", "error" or "disabled" (warm-up turned off)
+        and circuit is "open" while analysis fails fast because Ollama is down,
+        "half_open" while one trial request checks that it recovered, else "closed".
+    """
+    return json.dumps(dict(model_status, circuit=inference_breaker.state))
+
+
+@mcp.tool()
+async def inference_metrics() -> str:
+    """
+    Reports inference telemetry collected since the server started.
+    
+    Returns:
+        JSON object {"models": {model: {...}}, "prepare_seconds": {...}}. Per
+        model: call, error and early-stop counts plus histograms of wall time,
+        Ollama's total/load/prompt_eval/eval time, token counts, tokens per
+        second, payload size and image dimensions. prepare_seconds is the time
+        spent decoding, resizing and encoding images and video frames.
+    """
+    return json.dumps(metrics.snapshot())
+
+
+@mcp.tool()
+async def select_vision_model(force: bool = True) -> str:
+    """
+    Benchmarks the installed vision models on built-in sample screenshots
+    and switches to the most capable one that names an image within
+    VISION_LATENCY_SLO_MS. The choice is saved for VISION_MODEL=auto.
+    
+    Args:
+        force: Re-run the benchmark even if the saved selection still matches
+            this machine and the installed models (default: True).
+        
+    Returns:
+        JSON object {"model", "fingerprint", "slo_ms", "selected_at", "results"}
+        with per-model latency and answer validity, or an error message.
+    """
+    try:
+        return json.dumps(await auto_select_model(force))
+    except Exception as e:
+        return f"Error selecting vision model: {str(e)}"
+
+
+async def gather_limited(func, items):
+    """Runs func over items concurrently, at most BATCH_WORKERS at a time, preserving order."""
+    semaphore = asyncio.Semaphore(BATCH_WORKERS)
+    
+    async def run_one(item):
+        async with semaphore:
+            return await func(item)
+    
+    return await asyncio.gather(*(run_one(item) for item in items))
+
+
+@mcp.tool()
+async def analyze_images(local_paths: List[str]) -> str:
+    """
+    Batch version of analyze_image. Analyzes many files in one call,
+    running them concurrently on the server.
+    
+    Args:
+        local_paths: Absolute paths to the image or video files.
+        
+    Returns:
+        A JSON list with one object per input, in the same order:
+        {"local_path", "ok", "suggested_name"} or {"local_path", "ok", "error"}.
+    """
+    results = []
+    for local_path, text in zip(local_paths, await gather_limited(analyze_image, local_paths)):
+        if text.startswith("Error"):
+            results.append({"local_path": local_path, "ok": False, "error": text})
+        else:
+            results.append({"local_path": local_path, "ok": True, "suggested_name": text})
+    return json.dumps(results)
+
+
+@mcp.tool()
+async def upload_files(items: List[Dict[str, str]]) -> str:
+    """
+    Batch version of upload_file. Uploads many files in one call,
+    running the uploads concurrently on the server.
+    
+    Args:
+        items: List of {"local_path": ..., "folder_id": ...} objects.
+        
+    Returns:
+        A JSON list with one object per input, in the same order:
+        {"local_path", "ok", "file_id"} or {"local_path", "ok", "error"}.
+    """
+    async def upload_item(item):
+        return await upload_file(item.get("local_path", ""), item.get("folder_id", ""))
+    
+    results = []
+    for item, text in zip(items, await gather_limited(upload_item, items)):
+        local_path = item.get("local_path", "")
+        if text.startswith("Successfully"):
+            file_id = text.rsplit("File ID: ", 1)[-1]
+            results.append({"local_path": local_path, "ok": True, "file_id": file_id})
+        else:
+            results.append({"local_path": local_path, "ok": False, "error": text})
+    return json.dumps(results)
+
+
 if __name__ == "__main__":
+    start_services()
     mcp.run()
@@ -0,0 +1,118 @@
+import bisect
+from collections import defaultdict
+
+# Bucket upper bounds per kind of value; the last bucket is open-ended
+SECONDS_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+TOKEN_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+KILOBYTE_BUCKETS = [16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384]
+MEGAPIXEL_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16]
+PIXEL_BUCKETS = [256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192]
+
+NANOSECONDS = 1e9
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum, min and max."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (max for the open bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self):
+        buckets = {f"le_{bound:g}": count for bound, count in zip(self.bounds, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 4) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": buckets,
+        }
+
+
+class InferenceMetrics:
+    """
+    Aggregates per-call inference telemetry by model: the timings and token
+    counts Ollama reports, the wall time seen by the server, payload size
+    and image dimensions. Image preparation time is tracked separately, so
+    it's visible whether time goes to model load, encoding or generation.
+    """
+
+    # Ollama response field -> (metric name, bucket bounds, scale)
+    OLLAMA_FIELDS = {
+        "total_duration": ("total_seconds", SECONDS_BUCKETS, NANOSECONDS),
+        "load_duration": ("load_seconds", SECONDS_BUCKETS, NANOSECONDS),
+        "prompt_eval_duration": ("prompt_eval_seconds", SECONDS_BUCKETS, NANOSECONDS),
+        "eval_duration": ("eval_seconds", SECONDS_BUCKETS, NANOSECONDS),
+        "prompt_eval_count": ("prompt_tokens", TOKEN_BUCKETS, 1),
+        "eval_count": ("eval_tokens", TOKEN_BUCKETS, 1),
+    }
+
+    def __init__(self):
+        self._models = defaultdict(dict)
+        self._counters = defaultdict(lambda: defaultdict(int))
+        self.prepare = Histogram(SECONDS_BUCKETS)
+
+    def _observe(self, model, name, bounds, value):
+        histogram = self._models[model].get(name)
+        if histogram is None:
+            histogram = self._models[model][name] = Histogram(bounds)
+        histogram.observe(value)
+
+    def record_call(self, model, result, wall_seconds, payload_bytes, image_sizes=()):
+        """Records one successful generate call and its Ollama response stats."""
+        self._counters[model]["calls"] += 1
+        if result.get("done_reason") == "client_stop":
+            # Cut off early by the client: Ollama sent no final stats
+            self._counters[model]["client_stops"] += 1
+        self._observe(model, "wall_seconds", SECONDS_BUCKETS, wall_seconds)
+        self._observe(model, "payload_kb", KILOBYTE_BUCKETS, payload_bytes / 1024)
+        for field, (name, bounds, scale) in self.OLLAMA_FIELDS.items():
+            if result.get(field) is not None:
+                self._observe(model, name, bounds, result[field] / scale)
+        if result.get("eval_count") and result.get("eval_duration"):
+            self._observe(model, "tokens_per_second", TOKEN_BUCKETS,
+                          result["eval_count"] * NANOSECONDS / result["eval_duration"])
+        for size in image_sizes:
+            if size:
+                width, height = size
+                self._observe(model, "image_megapixels", MEGAPIXEL_BUCKETS, width * height / 1e6)
+                self._observe(model, "image_long_edge", PIXEL_BUCKETS, max(width, height))
+
+    def record_error(self, model):
+        self._counters[model]["errors"] += 1
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict."""
+        models = {}
+        for model in set(self._models) | set(self._counters):
+            models[model] = dict(self._counters[model])
+            models[model].update(
+                {name: histogram.to_dict() for name, histogram in sorted(self._models[model].items())}
+            )
+        return {"models": models, "prepare_seconds": self.prepare.to_dict()}
@@ -14,6 +14,31 @@ def main():
     else:
         print("[Config] Image analysis: DISABLED")
     
+    # Watch mode: keep running and process new files as they appear
+    # Set WATCH_MODE=1 to enable, WATCH_POLLING=1 to force the polling observer
+    watch = os.getenv("WATCH_MODE", "0").lower() in ["1", "true", "yes"]
+    watch_polling = os.getenv("WATCH_POLLING", "0").lower() in ["1", "true", "yes"]
+    poll_interval = float(os.getenv("WATCH_POLL_INTERVAL", "2.0"))
+    watch_report_files = int(os.getenv("WATCH_REPORT_FILES", "100"))
+    if watch:
+        print(f"[Config] Watch mode: ENABLED{' (polling)' if watch_polling else ''}")
+    
+    # Durable index of already-uploaded files (SQLite)
+    index_path = os.getenv("PROCESSED_INDEX_PATH", "processed_index.db")
+    index_content_hash = os.getenv("INDEX_CONTENT_HASH", "0").lower() in ["1", "true", "yes"]
+    
+    # Concurrency: MAX_WORKERS is the default for every pipeline stage,
+    # <STAGE>_WORKERS overrides a single stage
+    workers = int(os.getenv("MAX_WORKERS", "4"))
+    stage_workers = {}
+    for stage in ("analyze", "route", "upload", "cleanup"):
+        value = os.getenv(f"{stage.upper()}_WORKERS")
+        if value:
+            stage_workers[stage] = int(value)
+    max_inflight_bytes = int(float(os.getenv("MAX_INFLIGHT_MB", "512")) * 1024 * 1024)
+    batch_size = int(os.getenv("BATCH_SIZE", "8"))
+    model_ready_timeout = float(os.getenv("MODEL_READY_TIMEOUT", "300"))
+    
     # Check for credentials
     if not os.path.exists('credentials.json'):
         print("Error: credentials.json not found. Please place it in the application directory.")
@@ -26,7 +51,21 @@ def main():
     watch_dir = os.path.join(os.path.dirname(__file__), "test_screenshots")
     
     # Initialize and run client
-    client = AgentClient(watch_dir, analyze_images=analyze_images)
+    client = AgentClient(
+        watch_dir,
+        analyze_images=analyze_images,
+        watch=watch,
+        watch_polling=watch_polling,
+        poll_interval=poll_interval,
+        watch_report_files=watch_report_files,
+        index_path=index_path,
+        index_content_hash=index_content_hash,
+        workers=workers,
+        stage_workers=stage_workers,
+        max_inflight_bytes=max_inflight_bytes,
+        batch_size=batch_size,
+        model_ready_timeout=model_ready_timeout,
+    )
     
     try:
         asyncio.run(client.run())